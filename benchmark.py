@@ -0,0 +1,179 @@
+"""
+Scaling benchmark
+Generates synthetic LaTeX documents of growing size and measures the parser
+throughput and, with --render, the LaTeX compilations, construction (dry
+run) and render wall time of TexToManimScene with the settings of manim.cfg.
+Results are written as JSON; with --baseline the run fails when a metric is
+worse than the baseline by more than --threshold.
+
+Usage: python benchmark.py --scales 1 2 4 8 --render -o bench.json --baseline old.json
+"""
+
+from pathlib import Path
+from typing import Dict, List
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from processes import ProcessCounter, program
+from tex_parser import TexParser
+
+
+# Lower is better, compared against the baseline
+REGRESSION_METRICS = ("parse_seconds", "tex_compilations", "construct_seconds", "render_seconds")
+TEX_COMPILERS = ("latex", "pdflatex", "xelatex", "lualatex")
+
+PREAMBLE = r"""\documentclass{article}
+\usepackage{amsmath, amsthm, amsfonts, amssymb}
+\newcommand{\pause}{}
+\newtheorem{thm}{Theorem}[section]
+\newtheorem{lem}[thm]{Lemma}
+\newtheorem{prop}[thm]{Proposition}
+"""
+
+THEOREM_ENVIRONMENTS = ("thm", "lem", "prop")
+
+
+def synthetic_document(sections: int = 2, paragraphs: int = 3, theorems: int = 1, align_rows: int = 3,
+                       pauses: int = 2) -> str:
+    """A document of sections, each with paragraphs of text (pauses \\pause
+    per line), an equation and an align of align_rows rows per paragraph,
+    and theorems followed by a proof. Every snippet is distinct."""
+    lines = [PREAMBLE, r"\begin{document}"]
+    for s in range(sections):
+        lines.append(rf"\section{{Section {s}}}")
+        for p in range(paragraphs):
+            parts = [rf"Paragraph {p} of section {s} with $x_{{{s}}}^{{{p}}}+y_{{{k}}}$." for k in range(pauses + 1)]
+            lines.append(r" \pause ".join(parts))
+            lines += [r"\begin{equation*}", rf"\int_0^{{{s + 1}}} f_{{{p}}}(t)\,dt = {s * paragraphs + p}",
+                      r"\end{equation*}"]
+            lines.append(r"\begin{align*}")
+            rows = [rf"a_{{{s},{p},{r}}} \pause&= b_{{{r}}} + {r}" for r in range(align_rows)]
+            lines.append("\\\\\n".join(rows))
+            lines.append(r"\end{align*}")
+        for t in range(theorems):
+            environment = THEOREM_ENVIRONMENTS[t % len(THEOREM_ENVIRONMENTS)]
+            lines += [
+                rf"\begin{{{environment}}}[Result {s}.{t}]",
+                rf"Let $n_{{{t}}} \geq {s}$. \pause Then the bound holds.",
+                r"\begin{equation*}", rf"\sum_{{k=0}}^{{n_{{{t}}}}} k = \frac{{n(n+1)}}{{{s + 2}}}", r"\end{equation*}",
+                rf"\end{{{environment}}}",
+                r"\begin{proof}",
+                rf"By induction on $n_{{{t}}}$ in section {s}.",
+                r"\end{proof}",
+            ]
+    lines.append(r"\end{document}")
+    return "\n".join(lines) + "\n"
+
+
+def measure_parse(filename: str, repeat: int = 3) -> Dict:
+    """Best of repeat full parses, without the element cache"""
+    best, elements = float("inf"), []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        elements = TexParser(filename, quiet=True).parse()
+        best = min(best, time.perf_counter() - start)
+    size = os.path.getsize(filename)
+    return {
+        "bytes": size,
+        "elements": len(elements),
+        "parse_seconds": best,
+        "parse_mb_per_s": size / best / 1e6,
+        "elements_per_s": len(elements) / best,
+    }
+
+
+def tex_compilations(commands) -> int:
+    """TeX compiler runs among the commands of a ProcessCounter"""
+    return sum(program(command) in TEX_COMPILERS for command in commands)
+
+
+def measure_render(filename: str, work_dir: str) -> Dict:
+    """Dry run with a cold LaTeX cache, then a full render reusing it"""
+    from manim import tempconfig
+    from tex_manim_renderer import TexToManimScene
+
+    tex_cache = os.path.join(work_dir, "tex_cache")
+    os.chdir(work_dir)  # times.pkl and timeline.csv are written to the working directory
+    results = {}
+    for dry_run, metric in ((True, "construct_seconds"), (False, "render_seconds")):
+        with tempconfig({"media_dir": os.path.join(work_dir, "media"), "preview": False}):
+            scene = TexToManimScene(filename, dry_run=dry_run)
+            scene.TEX_CACHE_DIR = tex_cache
+            with ProcessCounter() as counter:  # Batch worker processes included
+                start = time.perf_counter()
+                scene.render()
+                results[metric] = time.perf_counter() - start
+        if dry_run:
+            results["tex_compilations"] = tex_compilations(counter.commands)
+            results["video_seconds"] = scene.timeline.total
+    return results
+
+
+def run(scales: List[int], base: Dict, render: bool = False, repeat: int = 3) -> List[Dict]:
+    results = []
+    with tempfile.TemporaryDirectory() as work_root:
+        for scale in scales:
+            params = dict(base, sections=base["sections"] * scale)
+            filename = os.path.join(work_root, f"synthetic_{scale}.tex")
+            Path(filename).write_text(synthetic_document(**params), encoding='utf-8')
+            result = {"scale": scale, **params, **measure_parse(filename, repeat)}
+            if render:
+                work_dir = os.path.join(work_root, f"render_{scale}")
+                cwd = os.getcwd()
+                os.makedirs(work_dir)
+                try:
+                    result.update(measure_render(filename, work_dir))
+                finally:
+                    os.chdir(cwd)
+            results.append(result)
+            print(json.dumps(result))
+    return results
+
+
+def regressions(results: List[Dict], baseline: List[Dict], threshold: float) -> List[str]:
+    """Metrics worse than the baseline of the same scale by more than threshold"""
+    previous = {result["scale"]: result for result in baseline}
+    failures = []
+    for result in results:
+        old = previous.get(result["scale"])
+        if old is None:
+            continue
+        for metric in REGRESSION_METRICS:
+            if metric in result and metric in old and result[metric] > old[metric] * (1 + threshold):
+                failures.append(f"scale {result['scale']}: {metric} {result[metric]:.4g} > {old[metric]:.4g} "
+                                f"(+{threshold:.0%})")
+    return failures
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Benchmark the parser and renderer on synthetic documents")
+    arguments.add_argument("--scales", type=int, nargs="+", default=[1, 2, 4, 8], help="Multiples of --sections")
+    arguments.add_argument("--sections", type=int, default=2)
+    arguments.add_argument("--paragraphs", type=int, default=3, help="Per section")
+    arguments.add_argument("--theorems", type=int, default=1, help="Per section")
+    arguments.add_argument("--align-rows", type=int, default=3)
+    arguments.add_argument("--pauses", type=int, default=2, help="Per paragraph")
+    arguments.add_argument("--repeat", type=int, default=5, help="Parses per document, the best is kept")
+    arguments.add_argument("--render", action="store_true", help="Also construct and render (needs LaTeX)")
+    arguments.add_argument("-o", "--output", default="benchmark.json")
+    arguments.add_argument("--baseline", default=None, help="Results of a previous run to compare with")
+    arguments.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown, 0.2 for 20%%")
+    args = arguments.parse_args()
+
+    base = dict(sections=args.sections, paragraphs=args.paragraphs, theorems=args.theorems,
+                align_rows=args.align_rows, pauses=args.pauses)
+    results = run(args.scales, base, args.render, args.repeat)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({"results": results, "threshold": args.threshold}, f, indent=1)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            failures = regressions(results, json.load(f)["results"], args.threshold)
+        for failure in failures:
+            print(f"Regression: {failure}")
+        if failures:
+            sys.exit(1)
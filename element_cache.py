@@ -0,0 +1,164 @@
+"""
+Element cache for incremental reparsing
+Stores parsed elements on disk, keyed by source file and by the content
+hash of each top-level block, so that only edited blocks are parsed again
+"""
+
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import copy
+import hashlib
+import os
+import pickle
+
+from tex_parser import TexElement, TexParser
+
+
+# Block layout of the last parse: (hash, number of lines, closed, first line)
+LayoutEntry = Tuple[str, int, bool, str]
+
+
+class ElementCache:
+    """Persisted, content-hashed cache of parsed TexElements
+
+    Besides the elements of every block, the cache keeps the block layout of
+    the last parse. Unchanged blocks are then recognised by hashing the same
+    line ranges again, and only edited regions go through the block splitter
+    and the parser.
+    """
+
+    VERSION = 2  # Bump when the element classes or the parser output change
+    RESYNC_CANDIDATES = 4  # Stored blocks tried to resync after an edit
+
+    def __init__(self, cache_dir: str = ".tex_cache"):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+
+    def iter_elements(self, parser: TexParser, lines: Iterable[str], first_line: int = 1) -> Iterator[TexElement]:
+        """Yield the elements of the source lines, parsing only the blocks
+        that are not in the cache. The cache file is rewritten once all the
+        lines have been consumed."""
+        lines = lines if isinstance(lines, list) else list(lines)
+        cached, cached_layout = self.load(parser.filename)
+        heads: Dict[str, List[int]] = {}
+        for index, entry in enumerate(cached_layout):
+            heads.setdefault(entry[3], []).append(index)
+
+        blocks: Dict[str, Tuple[int, List[TexElement]]] = {}
+        layout: List[LayoutEntry] = []
+        pos = 0  # Index of the first line not consumed yet
+        index = 0  # Stored block expected at pos
+        splitter, splitter_pos = None, -1
+        while pos < len(lines):
+            start = first_line + pos
+            matched = self._match_layout(cached_layout, heads, cached, index, lines, pos)
+            if matched is not None:
+                # Fast path: the stored block is unchanged
+                index = matched + 1
+                key, size, closed, _ = cached_layout[matched]
+            else:
+                # Split from pos, reusing the splitter across consecutive edits
+                if splitter_pos != pos:
+                    remaining = (lines[i] for i in range(pos, len(lines)))
+                    splitter = parser.iter_blocks(remaining, start)
+                found = next(splitter, None)
+                if found is None:
+                    break  # \end{document}
+                _, block, closed = found
+                key, size = block_hash(block), len(block)
+                splitter_pos = pos + size
+
+            if key in blocks:
+                stored_start, elements = blocks[key]
+                elements = shift_line_numbers(elements, start - stored_start)
+            elif key in cached:
+                # Freshly loaded, so not shared with anything yet
+                self.hits += 1
+                stored_start, elements = cached[key]
+                move_line_numbers(elements, start - stored_start)
+            else:
+                self.misses += 1
+                elements = list(parser.spawn().iter_lines(lines[pos:pos + size], start))
+
+            blocks.setdefault(key, (start, elements))
+            layout.append((key, size, closed, lines[pos]))
+            pos += size
+            yield from elements
+            if not closed:
+                break
+
+        # Only the blocks of the current version are kept
+        self.save(parser.filename, blocks, layout)
+        if not parser.quiet:
+            print(f"Element cache: {self.hits} blocks reused, {self.misses} parsed")
+
+    def _match_layout(self, layout: List[LayoutEntry], heads: Dict[str, List[int]],
+                      cached: Dict[str, Tuple[int, List[TexElement]]],
+                      index: int, lines: List[str], pos: int) -> Optional[int]:
+        """Index of a stored closed block whose lines are found unchanged at
+        pos, trying the expected one first and then the next stored blocks
+        starting with the same line"""
+        candidates = heads.get(lines[pos], [])
+        first = bisect_left(candidates, index)
+        for candidate in candidates[first:first + self.RESYNC_CANDIDATES]:
+            key, size, closed, _ = layout[candidate]
+            if (closed and key in cached and pos + size <= len(lines)
+                    and block_hash(lines[pos:pos + size]) == key):
+                return candidate
+        return None
+
+    def load(self, filename: str) -> Tuple[Dict[str, Tuple[int, List[TexElement]]], List[LayoutEntry]]:
+        """Cached blocks and layout of a file, empty if missing or stale"""
+        try:
+            with open(self._path(filename), 'rb') as f:
+                version, blocks, layout = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ValueError):
+            return {}, []
+        return (blocks, layout) if version == self.VERSION else ({}, [])
+
+    def save(self, filename: str, blocks: Dict[str, Tuple[int, List[TexElement]]], layout: List[LayoutEntry]):
+        """Write the blocks and layout of a file, atomically"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(filename)
+        tmp = f"{path}.{os.getpid()}.tmp"  # Parallel renders save concurrently
+        with open(tmp, 'wb') as f:
+            pickle.dump((self.VERSION, blocks, layout), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+
+    def _path(self, filename: str) -> str:
+        key = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.pkl")
+
+
+def block_hash(block: List[str]) -> str:
+    return hashlib.sha1(''.join(block).encode('utf-8')).hexdigest()
+
+
+def move_line_numbers(elements: List[TexElement], delta: int, moved: Optional[Set[int]] = None):
+    """Move elements (and their content) by delta lines, in place. Nested
+    environments can share content elements, each one is moved once."""
+    if delta == 0:
+        return
+    moved = set() if moved is None else moved
+    for element in elements:
+        if id(element) in moved:
+            continue
+        moved.add(id(element))
+        element.line_number += delta
+        if isinstance(getattr(element, 'content', None), list):
+            move_line_numbers(element.content, delta, moved)
+
+
+def shift_line_numbers(elements: List[TexElement], delta: int) -> List[TexElement]:
+    """Copies of elements (and of their content) moved by delta lines"""
+    if delta == 0:
+        return elements
+    shifted = []
+    for element in elements:
+        element = copy.copy(element)
+        element.line_number += delta
+        if isinstance(getattr(element, 'content', None), list):
+            element.content = shift_line_numbers(element.content, delta)
+        shifted.append(element)
+    return shifted
@@ -0,0 +1,80 @@
+"""
+Keyframes at the checkpoints
+Every partial movie starts with an IDR frame and the checkpoints fall
+between partial movies, so a player jumping to a slide already decodes from
+a keyframe. KeyframeFileWriter asks the encoder for more keyframes while the
+partial movies are encoded, instead of re-encoding the video afterwards: the
+frames right after each checkpoint (intra-only, or every few frames), so that
+seeking a little past a pause stays cheap, and a bounded distance between
+keyframes elsewhere. Needs manim < 0.19, which encodes through an ffmpeg
+pipe (manim 0.19 encodes with PyAV).
+"""
+
+from types import SimpleNamespace
+from typing import List, Optional
+import subprocess
+
+import manim
+from manim import config
+from manim.scene import scene_file_writer
+from manim.scene.scene_file_writer import SceneFileWriter
+
+
+# manim < 0.19: the partial movies are encoded by an ffmpeg process the options can be passed to
+ENCODER_PIPE = hasattr(SceneFileWriter, "open_movie_pipe")
+
+
+def check_encoder_pipe():
+    if not ENCODER_PIPE:
+        raise Exception(f"Keyframes at checkpoints need manim < 0.19 (ffmpeg pipe), found manim {manim.__version__}")
+
+
+def keyframe_options(window: float = 0.0, interval: Optional[float] = None) -> List[str]:
+    """ffmpeg options of a partial movie starting at a checkpoint: a keyframe
+    every interval seconds during its first window seconds, or every frame
+    when interval is None"""
+    if window <= 0:
+        return []
+    expression = f"lte(t,{window})"
+    if interval:
+        expression += f"*gte(t,n_forced*{interval})"
+    return ["-force_key_frames", f"expr:{expression}", "-forced-idr", "1"]
+
+
+class KeyframeFileWriter(SceneFileWriter):
+    """Scene file writer passing options to the encoder of every partial
+    movie, and checkpoint_options to the first one after mark_checkpoint().
+    Only for libx264 (.mp4): the options are ignored in other formats."""
+
+    def __init__(self, *args, **kwargs):
+        self.options: List[str] = []
+        self.checkpoint_options: List[str] = []
+        self.at_checkpoint = True  # The video starts at the first checkpoint
+        self.pipe_options: List[str] = []  # Options of the partial movie being written
+        super().__init__(*args, **kwargs)
+
+    def mark_checkpoint(self):
+        self.at_checkpoint = True
+
+    def begin_animation(self, allow_write: bool = False, file_path=None):
+        # Cached and skipped animations consume the checkpoint too
+        self.pipe_options = self.options + (self.checkpoint_options if self.at_checkpoint else [])
+        self.at_checkpoint = False
+        super().begin_animation(allow_write, file_path)
+
+    def open_movie_pipe(self, file_path=None):
+        if not self.pipe_options or config.movie_file_extension != ".mp4" or config.transparent:
+            super().open_movie_pipe(file_path)
+            return
+        options = self.pipe_options
+
+        def popen(command, *args, **kwargs):
+            # The output file is the last argument
+            return subprocess.Popen([*command[:-1], *options, command[-1]], *args, **kwargs)
+
+        # Only the ffmpeg pipe opened by manim's file writer module sees the options
+        scene_file_writer.subprocess = SimpleNamespace(Popen=popen, PIPE=subprocess.PIPE)
+        try:
+            super().open_movie_pipe(file_path)
+        finally:
+            scene_file_writer.subprocess = subprocess
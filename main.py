@@ -3,8 +3,7 @@ from tex_manim_renderer import TexToManimScene
 
 
 class MyPresentation(TexToManimScene):
-    def __init__(self, **kwargs):
-        super().__init__("SteinWeiss.tex", **kwargs)
+    LATEX_FILENAME = "SteinWeiss.tex"
 
 # Render with:
 # manim -pql main.py MyPresentation
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""
+Multi-quality output
+Renders one scene construction to several output profiles (resolution and
+frame rate): besides the main output, every frame is rasterized by one
+camera per extra profile and encoded by its own file writer. The parsing,
+LaTeX compilations and layout run once.
+
+Usage: python multi_quality.py main.py MyPresentation -q h l
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import argparse
+import math
+
+import numpy as np
+from manim import Camera, config, tempconfig
+from manim.constants import QUALITIES as MANIM_QUALITIES
+from manim.utils.iterables import list_update
+
+from keyframes import KeyframeFileWriter
+from section_render import QUALITIES, load_scene_class
+from static_frames import HoldingRenderer
+
+
+@dataclass
+class OutputTarget:
+    """Extra output: config overrides, camera and file writer"""
+    profile: Dict
+    camera: Camera
+    file_writer: KeyframeFileWriter
+    next_time: float = 0.0  # Video time of its next frame
+    frame: Optional[np.ndarray] = None  # Last frame, reused while the scene is not redrawn
+
+
+def profile_frame_rate(profile: Dict) -> float:
+    if "frame_rate" in profile:
+        return profile["frame_rate"]
+    if "quality" in profile:
+        return MANIM_QUALITIES[profile["quality"]]["frame_rate"]
+    return config.frame_rate
+
+
+class TargetFileWriter(KeyframeFileWriter):
+    """File writer of the main output that also opens, closes and combines
+    the partial movies of the extra outputs"""
+
+    def targets(self) -> List[OutputTarget]:
+        return getattr(self.renderer, 'targets', [])
+
+    def add_partial_movie_file(self, hash_animation: str):
+        super().add_partial_movie_file(hash_animation)
+        for target in self.targets():
+            with tempconfig(target.profile):
+                target.file_writer.add_partial_movie_file(hash_animation)
+
+    def is_already_cached(self, hash_invocation: str) -> bool:
+        return super().is_already_cached(hash_invocation) and all(
+            target.file_writer.is_already_cached(hash_invocation) for target in self.targets()
+        )
+
+    def begin_animation(self, allow_write: bool = False, file_path=None):
+        super().begin_animation(allow_write, file_path)
+        for target in self.targets():
+            with tempconfig(target.profile):
+                target.file_writer.begin_animation(allow_write)
+
+    def end_animation(self, allow_write: bool = False):
+        super().end_animation(allow_write)
+        for target in self.targets():
+            with tempconfig(target.profile):
+                target.file_writer.end_animation(allow_write)
+
+    def finish(self):
+        super().finish()
+        for target in self.targets():
+            with tempconfig(target.profile):
+                target.file_writer.finish()
+
+
+class MultiTargetRenderer(HoldingRenderer):
+    """HoldingRenderer writing every frame to the extra output profiles too.
+    The main output should have the highest frame rate: the frames of the
+    others are sampled from its frames."""
+
+    def __init__(self, profiles: List[Dict], *args, **kwargs):
+        super().__init__(*args, file_writer_class=TargetFileWriter, **kwargs)
+        self.profiles = profiles
+        self.targets: List[OutputTarget] = []
+        self.scene = None
+        self.redrawn = True  # Scene drawn since the extra outputs last rasterized it
+
+    def init_scene(self, scene):
+        self.scene = scene
+        self.targets = []
+        for profile in self.profiles:
+            with tempconfig(profile):
+                self.targets.append(OutputTarget(profile, Camera(), KeyframeFileWriter(self, scene.__class__.__name__)))
+        super().init_scene(scene)
+
+    def update_frame(self, *args, **kwargs):
+        super().update_frame(*args, **kwargs)
+        self.redrawn = True
+
+    def add_frame(self, frame: np.ndarray, num_frames: int = 1):
+        if self.skip_animations:
+            return
+        start = self.time
+        super().add_frame(frame, num_frames)
+        for target in self.targets:
+            dt = 1 / target.camera.frame_rate
+            if target.next_time < start:
+                # Skipped or cached animations
+                target.next_time += math.ceil((start - target.next_time) / dt - 1e-9) * dt
+            count = 0
+            while target.next_time < self.time - 1e-9:
+                target.next_time += dt
+                count += 1
+            if not count:
+                continue
+            if self.redrawn or target.frame is None:
+                target.camera.reset()
+                target.camera.capture_mobjects(list_update(self.scene.mobjects, self.scene.foreground_mobjects))
+                target.frame = np.array(target.camera.pixel_array)
+            for _ in range(count):
+                target.file_writer.write_frame(target.frame)
+        self.redrawn = False
+
+    def movie_files(self) -> List[str]:
+        """Videos of the extra outputs"""
+        return [str(target.file_writer.movie_file_path) for target in self.targets]
+
+
+def render_qualities(scene_file: str, scene_name: str, qualities: List[str]) -> List[str]:
+    """Render a TexToManimScene subclass once in several manim qualities
+    (l, m, h, p, k) and return the paths of the videos"""
+    profiles = [{"quality": QUALITIES[quality]} for quality in qualities]
+    profiles.sort(key=lambda profile: -profile_frame_rate(profile))  # Highest frame rate as main output
+    with tempconfig(profiles[0]):
+        scene = load_scene_class(scene_file, scene_name)(outputs=profiles[1:])
+        scene.render()
+        return [str(scene.renderer.file_writer.movie_file_path), *scene.renderer.movie_files()]
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Render a presentation in several qualities at once")
+    arguments.add_argument("scene_file", help="Python file defining the scene, e.g. main.py")
+    arguments.add_argument("scene_name", help="TexToManimScene subclass, e.g. MyPresentation")
+    arguments.add_argument("-q", "--qualities", nargs="+", choices=QUALITIES, default=["l", "h"],
+                           help="Manim quality flags")
+    args = arguments.parse_args()
+
+    for movie in render_qualities(args.scene_file, args.scene_name, args.qualities):
+        print(f"Video: {movie}")
@@ -0,0 +1,69 @@
+"""
+Process launch counting
+Reports every process started with subprocess or os.system while a
+ProcessCounter is entered. Worker processes collect their own launches with
+a ProcessCounter and return them, so that the parent reports them too (see
+tex_compile.compile_snippets).
+"""
+
+from pathlib import Path
+from typing import Callable, List, Optional
+import os
+import subprocess
+
+
+def program(command) -> str:
+    """Name of the program a reported command runs, without folder or extension"""
+    executable = command.split()[0] if isinstance(command, str) else command[0]
+    return Path(executable).stem
+
+
+class ProcessCounter:
+    """Collects the commands launched while entered, and passes each to
+    on_launch. Counters nest: a launch is reported to every active one."""
+
+    active: List['ProcessCounter'] = []
+    originals = None  # (Popen._execute_child, os.system) while a counter is active
+
+    def __init__(self, on_launch: Optional[Callable[[object], None]] = None):
+        self.on_launch = on_launch
+        self.commands: list = []
+
+    def __enter__(self) -> 'ProcessCounter':
+        if not ProcessCounter.active:
+            execute_child, system = subprocess.Popen._execute_child, os.system
+
+            def counted_execute_child(popen, args, *rest, **kwargs):
+                ProcessCounter.launched(args)
+                return execute_child(popen, args, *rest, **kwargs)
+
+            def counted_system(command):
+                ProcessCounter.launched(command)
+                return system(command)
+
+            ProcessCounter.originals = (execute_child, system)
+            subprocess.Popen._execute_child, os.system = counted_execute_child, counted_system
+        ProcessCounter.active.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        ProcessCounter.active.remove(self)
+        if not ProcessCounter.active:
+            subprocess.Popen._execute_child, os.system = ProcessCounter.originals
+            ProcessCounter.originals = None
+
+    @property
+    def count(self) -> int:
+        return len(self.commands)
+
+    @staticmethod
+    def launched(command):
+        """Report a launch, in this process or in a worker"""
+        if isinstance(command, (str, bytes, os.PathLike)):
+            command = os.fsdecode(command)
+        else:
+            command = [os.fsdecode(part) for part in command]
+        for counter in list(ProcessCounter.active):
+            counter.commands.append(command)
+            if counter.on_launch is not None:
+                counter.on_launch(command)
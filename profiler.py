@@ -0,0 +1,182 @@
+"""
+Render profiler
+Wall time, process launches and peak memory of every top-level element of
+a render, split by stage: LaTeX compilation, mobject construction (SVG
+parsing), Cairo rasterization and encoding. Elements are keyed by their
+source line; the report is written as profile.json and printed as a top-N.
+"""
+
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import functools
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from manim.mobject.text import tex_mobject
+
+from processes import ProcessCounter
+from tex_compile import TexSpec
+
+
+STAGES = ("latex", "mobject", "rasterize", "encode")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of the process so far"""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+@dataclass
+class StageProfile:
+    seconds: float = 0.0  # Without the nested stages
+    processes: int = 0
+
+
+@dataclass
+class ElementProfile:
+    element: str
+    source: str  # file:line
+    wall: float = 0.0
+    processes: int = 0
+    peak_rss_mb: float = 0.0  # Peak of the process at the end of the element
+    rss_growth_mb: float = 0.0  # Increase of that peak during the element
+    stages: Dict[str, StageProfile] = field(default_factory=dict)
+
+    @property
+    def other(self) -> float:
+        """Layout, animation and bookkeeping time"""
+        return self.wall - sum(stage.seconds for stage in self.stages.values())
+
+
+class Profiler:
+    """Collects ElementProfiles while installed()"""
+
+    def __init__(self):
+        self.records: Dict[str, ElementProfile] = {}
+        self.current: Optional[ElementProfile] = None
+        self.stack: List[list] = []  # [stage, start, nested seconds] of the open stages
+
+    @contextmanager
+    def element(self, name: str, source: str) -> Iterator[ElementProfile]:
+        """Profile everything run inside as the element at source"""
+        record = self.records.setdefault(f"{source} {name}", ElementProfile(name, source))
+        previous, self.current = self.current, record
+        start, peak = time.perf_counter(), peak_rss_mb()
+        try:
+            yield record
+        finally:
+            record.wall += time.perf_counter() - start
+            record.peak_rss_mb = peak_rss_mb()
+            record.rss_growth_mb += record.peak_rss_mb - peak
+            self.current = previous
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        if self.current is None:
+            yield
+            return
+        frame = [name, time.perf_counter(), 0.0]
+        self.stack.append(frame)
+        try:
+            yield
+        finally:
+            self.stack.pop()
+            elapsed = time.perf_counter() - frame[1]
+            self.current.stages.setdefault(name, StageProfile()).seconds += elapsed - frame[2]
+            if self.stack:
+                self.stack[-1][2] += elapsed
+
+    def transfer(self, stage: str, seconds: Dict[Tuple[str, str], float]):
+        """Move time of a stage of the current element to the (element,
+        source) it was spent for, e.g. the LaTeX time of the batch to the
+        elements whose snippets it compiled. Scaled down to the stage time
+        when the work ran in parallel."""
+        own = self.current.stages.get(stage) if self.current is not None else None
+        total = sum(seconds.values())
+        if own is None or total <= 0:
+            return
+        scale = min(1.0, own.seconds / total)
+        for (name, source), share in seconds.items():
+            record = self.records.setdefault(f"{source} {name}", ElementProfile(name, source))
+            record.stages.setdefault(stage, StageProfile()).seconds += share * scale
+            record.wall += share * scale
+            own.seconds -= share * scale
+            self.current.wall -= share * scale
+
+    def timed(self, name: str, function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with self.stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+
+    def count_process(self):
+        if self.current is None:
+            return
+        self.current.processes += 1
+        name = self.stack[-1][0] if self.stack else "other"
+        self.current.stages.setdefault(name, StageProfile()).processes += 1
+
+    @contextmanager
+    def installed(self, scene) -> Iterator['Profiler']:
+        """Time the stages of scene's render"""
+        renderer, file_writer = scene.renderer, scene.renderer.file_writer
+        patches = [
+            (tex_mobject, "tex_to_svg_file", self.timed("latex", tex_mobject.tex_to_svg_file)),
+            (TexSpec, "build", self.timed("mobject", TexSpec.build)),
+            (renderer, "update_frame", self.timed("rasterize", renderer.update_frame)),
+            (file_writer, "write_frame", self.timed("encode", file_writer.write_frame)),
+            (file_writer, "end_animation", self.timed("encode", file_writer.end_animation)),
+        ]
+        originals = [(target, name, target.__dict__.get(name)) for target, name, _ in patches]
+        for target, name, patch in patches:
+            setattr(target, name, patch)
+        try:
+            # Launches of the batch worker processes included
+            with ProcessCounter(lambda command: self.count_process()):
+                yield self
+        finally:
+            for target, name, original in originals:
+                if original is None:
+                    delattr(target, name)  # Bound method, found on the class again
+                else:
+                    setattr(target, name, original)
+
+    def ranking(self) -> List[ElementProfile]:
+        return sorted(self.records.values(), key=lambda record: -record.wall)
+
+    def save(self, path: str = "profile.json"):
+        totals = {name: StageProfile() for name in STAGES}
+        for record in self.records.values():
+            for name, stage in record.stages.items():
+                total = totals.setdefault(name, StageProfile())
+                total.seconds += stage.seconds
+                total.processes += stage.processes
+        report = {
+            "elements": [dict(asdict(record), other=record.other) for record in self.ranking()],
+            "stages": {name: asdict(stage) for name, stage in totals.items()},
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=1)
+
+    def report(self, top: int = 10) -> str:
+        """Text table of the top slowest elements"""
+        total = sum(record.wall for record in self.records.values()) or 1.0
+        lines = [f"{'source':<28} {'element':<12} {'wall':>8} {'share':>6} "
+                 + " ".join(f"{name:>9}" for name in STAGES) + f" {'other':>8} {'procs':>6} {'peak MB':>8}"]
+        for record in self.ranking()[:top]:
+            stages = " ".join(f"{record.stages.get(name, StageProfile()).seconds:>9.2f}" for name in STAGES)
+            lines.append(f"{record.source:<28} {record.element:<12} {record.wall:>8.2f} "
+                         f"{record.wall / total:>6.1%} {stages} {record.other:>8.2f} "
+                         f"{record.processes:>6} {record.peak_rss_mb:>8.0f}")
+        return "\n".join(lines)
@@ -2,17 +2,20 @@ import cv2
 import time
 import numpy as np
 import pickle
+import queue
+import threading
 
 NAME_VIDEO = 'LaTex.mp4'
 
-WAITING_KEY = 10 # Time in milliseconds to wait for a key press
+WAITING_KEY = 10 # Maximum time in milliseconds between two checks of the keyboard
+BUFFER_FRAMES = 32 # Frames decoded ahead of playback
 NAME_WINDOW = 'Manim player'
 TARGET_WIDTH, TARGET_HEIGHT = 800, 600
 
 with open('times.pkl','rb') as file:
     PAUSE_TIMES = pickle.load(file)
 
-PAUSE_TIMES = [1, 2, 3, 4, 5, 6,7,8,9,10,11,12,13,14] 
+PAUSE_TIMES = [1, 2, 3, 4, 5, 6,7,8,9,10,11,12,13,14]
 
 print(PAUSE_TIMES)
 
@@ -21,9 +24,101 @@ ARROW_LEFT = 37
 ARROW_UP = 38
 ARROW_RIGHT = 39
 ARROW_DOWN = 40
+ENTER_KEY = 13
 
 # TODO: Implement a good video with Manim and define the list of pauses to import here.
 
+
+class FrameReader(threading.Thread):
+    """Decodes the video in the background into a bounded buffer of
+    (generation, time in ms, frame) with the frames already resized for
+    display. A frame of None marks the end of the video. seek() drops the
+    buffered frames: frames of an older generation are skipped by get()."""
+
+    def __init__(self, cap, size, buffer_frames=BUFFER_FRAMES):
+        super().__init__(daemon=True)
+        self.cap = cap
+        self.size = size
+        self.frames = queue.Queue(maxsize=buffer_frames)
+        self.lock = threading.Lock()  # Guards seek_ms and generation, never held while decoding
+        self.seek_ms = None
+        self.generation = 0
+        self.stopped = threading.Event()
+        self.frame_ms = 1000 / (cap.get(cv2.CAP_PROP_FPS) or 25)
+
+    def run(self):
+        index = 0
+        while not self.stopped.is_set():
+            with self.lock:
+                seek_ms, self.seek_ms = self.seek_ms, None
+                generation = self.generation
+            # Only this thread uses cap
+            if seek_ms is not None:
+                self.cap.set(cv2.CAP_PROP_POS_MSEC, max(0, seek_ms))
+                index = int(max(0, seek_ms) / self.frame_ms)
+            ret, frame = self.cap.read()
+            time_ms = self.cap.get(cv2.CAP_PROP_POS_MSEC) or index * self.frame_ms
+            index += 1
+            if ret:
+                frame = self.resize(frame)
+            else:
+                frame = None
+            self.put((generation, time_ms, frame))
+            if frame is None:
+                # End of the video: wait for a seek
+                while not self.stopped.is_set() and self.seek_ms is None:
+                    time.sleep(WAITING_KEY / 1000)
+
+    def resize(self, frame):
+        """Fit the frame in the display size, keeping its aspect ratio"""
+        height, width = frame.shape[:2]
+        scale = min(self.size[0] / width, self.size[1] / height)
+        if scale == 1:
+            return frame
+        return cv2.resize(frame, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+    def put(self, item):
+        while not self.stopped.is_set() and self.seek_ms is None:
+            try:
+                self.frames.put(item, timeout=WAITING_KEY / 1000)
+                return
+            except queue.Full:
+                continue
+
+    def get(self, timeout):
+        """Next frame of the current generation, None if none is decoded in time"""
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                item = self.frames.get(timeout=max(0, deadline - time.perf_counter()))
+            except queue.Empty:
+                return None
+            if item[0] == self.generation:
+                return item
+
+    def seek(self, time_ms):
+        with self.lock:
+            self.seek_ms = time_ms
+            self.generation += 1
+        while True:
+            try:
+                self.frames.get_nowait()
+            except queue.Empty:
+                break
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def toggle_full_screen(full_screen):
+    if full_screen:
+        cv2.setWindowProperty(NAME_WINDOW, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_NORMAL)
+    else:
+        cv2.setWindowProperty(NAME_WINDOW, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+    return not full_screen
+
+
 def video_player(video_path):
 
     cap = cv2.VideoCapture(video_path)
@@ -33,122 +128,121 @@ def video_player(video_path):
     cv2.namedWindow(NAME_WINDOW, cv2.WND_PROP_FULLSCREEN)
     cv2.resizeWindow(NAME_WINDOW, TARGET_WIDTH, TARGET_HEIGHT)
 
+    reader = FrameReader(cap, (TARGET_WIDTH, TARGET_HEIGHT))
+    reader.start()
+
     QUIT = False
     FULL_SCREEN = False
 
     pause_ms = [t * 1000 for t in PAUSE_TIMES]
     current_pause_index = 0
 
-    while cap.isOpened() & (not QUIT):        
-        # Read the current frame. If frame is read correctly, ret is True.
-        ret, frame = cap.read()
-
-        if ret:
-            # Get the position of the frame in video in milliseconds.
-            current_time_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
-
-            # Check if we are at one of the checkpoints
-            if current_pause_index < len(pause_ms) and current_time_ms >= pause_ms[current_pause_index]:
-                print('Manim player: paused...')
-
-                A = cv2.waitKey(WAITING_KEY) 
-                while A != 13: # 13 is the code for ENTER_KEY
-                    if A == ord('q'):
-                        print("Sono entrato in Q")
-                        QUIT = True
-                        break
-                    if A == ord('f'):
-                        # Mode full screen
-                        print("Sono entrato in Full screen")
-                        if FULL_SCREEN:
-                            cv2.resizeWindow(NAME_WINDOW, TARGET_WIDTH, TARGET_HEIGHT)
-                            #cv2.setWindowProperty(NAME_WINDOW, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_NORMAL)
-                            FULL_SCREEN = False
-                        else:
-                            cv2.setWindowProperty(NAME_WINDOW, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
-                            FULL_SCREEN = True
-                    if A & 0xFF == ARROW_RIGHT:
-                        # skip animation
-                        current_pause_index = np.min([len(pause_ms)-1, current_pause_index+1]) 
-                        cap.set(cv2.CAP_PROP_POS_MSEC, pause_ms[current_pause_index]-2)
-                        ret, frame = cap.read()
-                        if ret:
-                            cv2.imshow(NAME_WINDOW, frame)
-                    if A & 0xFF == ARROW_LEFT:
-                        # previous animation
-                        current_pause_index = np.max([0, current_pause_index-1]) 
-                        cap.set(cv2.CAP_PROP_POS_MSEC, pause_ms[current_pause_index]-2)
-                        ret, frame = cap.read()
-                        if ret:
-                            cv2.imshow(NAME_WINDOW, frame)
-
-                    print(f'You pressed {A}, you have to press ENTER to continue')
-                    A = cv2.waitKey(0)
-                    cv2.imshow(NAME_WINDOW, frame)
-                
-                print('Manim player: resuming...')
-                current_pause_index += 1
-            
-            A = cv2.waitKey(WAITING_KEY)
-            if A & 0xFF == ord('q'):
-                break
-            if A & 0xFF == ord('f'):
-                # Mode full screen
-                if FULL_SCREEN:
-                    cv2.setWindowProperty(NAME_WINDOW, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_NORMAL)
-                    FULL_SCREEN = False
-                else:
-                    cv2.setWindowProperty(NAME_WINDOW, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
-                    FULL_SCREEN = True
-            if A & 0xFF == ARROW_RIGHT:
-                # skip animation
-                current_pause_index = np.min([len(pause_ms)-1, current_pause_index+1]) 
-                cap.set(cv2.CAP_PROP_POS_MSEC, pause_ms[current_pause_index]-2)
-                ret, frame = cap.read()
-                if ret:
-                    cv2.imshow(NAME_WINDOW, frame)
-            if A & 0xFF == ARROW_LEFT:
-                # previous animation
-                current_pause_index = np.max([0, current_pause_index-1]) 
-                cap.set(cv2.CAP_PROP_POS_MSEC, pause_ms[current_pause_index]-2)
-                ret, frame = cap.read()
-                if ret:
-                    cv2.imshow(NAME_WINDOW, frame)
-
+    frame = None # Frame on screen
+    pending = None # Next frame, shown when its time comes
+    clock = None # (wall time, video time in ms) playback is paced from
+    seeking = False # A jump waits for its frame
+
+    def jump(index):
+        # Seek to a pause without waiting for the decoder: its frame is shown when it arrives
+        nonlocal pending, clock, seeking
+        reader.seek(pause_ms[index]-2)
+        pending, clock, seeking = None, None, True
+
+    def show_seeked():
+        # While paused, show the frame of the last jump once decoded
+        nonlocal frame, seeking
+        if not seeking:
+            return
+        item = reader.get(timeout=0)
+        if item is None:
+            return
+        seeking = False
+        if item[2] is not None:
+            frame = item[2]
             cv2.imshow(NAME_WINDOW, frame)
-            
-        else:
+
+    def handle_key(A):
+        # Keys available during playback and at the end of the video
+        nonlocal QUIT, FULL_SCREEN, current_pause_index
+        if A & 0xFF == ord('q'):
+            QUIT = True
+        if A & 0xFF == ord('f'):
+            # Mode full screen
+            FULL_SCREEN = toggle_full_screen(FULL_SCREEN)
+        if A & 0xFF == ARROW_RIGHT:
+            # skip animation
+            current_pause_index = np.min([len(pause_ms)-1, current_pause_index+1])
+            jump(current_pause_index)
+        if A & 0xFF == ARROW_LEFT:
+            # previous animation
+            current_pause_index = np.max([0, current_pause_index-1])
+            jump(current_pause_index)
+
+    while not QUIT:
+        if pending is None:
+            pending = reader.get(timeout=WAITING_KEY / 1000)
+            if pending is None:
+                # The decoder is behind: keep handling keys
+                handle_key(cv2.waitKey(1))
+                continue
+            seeking = False
+
+        _, current_time_ms, next_frame = pending
+        if next_frame is None:
             # We reach the end of the video, we close the window only if 'q' is pressed
             # We still give the possibility to the user to go back and forth of resize the screen
-            A = cv2.waitKey(0)
-            if A & 0xFF == ord('q'):
-                break
-            if A & 0xFF == ord('f'):
-                # Mode full screen
-                if FULL_SCREEN:
-                    cv2.setWindowProperty(NAME_WINDOW, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_NORMAL)
-                    FULL_SCREEN = False
-                else:
-                    cv2.setWindowProperty(NAME_WINDOW, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
-                    FULL_SCREEN = True
-            if A & 0xFF == ARROW_RIGHT:
-                # skip animation
-                current_pause_index = np.min([len(pause_ms)-1, current_pause_index+1]) 
-                cap.set(cv2.CAP_PROP_POS_MSEC, pause_ms[current_pause_index]-2)
-                ret, frame = cap.read()
-                if ret:
-                    cv2.imshow(NAME_WINDOW, frame)
-            if A & 0xFF == ARROW_LEFT:
-                # previous animation
-                current_pause_index = np.max([0, current_pause_index-1]) 
-                cap.set(cv2.CAP_PROP_POS_MSEC, pause_ms[current_pause_index]-2)
-                ret, frame = cap.read()
-                if ret:
+            handle_key(cv2.waitKey(WAITING_KEY))
+            continue
+
+        # Present the frame at its timestamp, checking the keyboard meanwhile
+        if clock is None:
+            clock = (time.perf_counter(), current_time_ms)
+        delay_ms = clock[0] * 1000 + current_time_ms - clock[1] - time.perf_counter() * 1000
+        if delay_ms >= 1:
+            handle_key(cv2.waitKey(int(min(delay_ms, WAITING_KEY))))
+            continue
+
+        frame, pending = next_frame, None
+        cv2.imshow(NAME_WINDOW, frame)
+
+        # Check if we are at one of the checkpoints
+        if current_pause_index < len(pause_ms) and current_time_ms >= pause_ms[current_pause_index]:
+            print('Manim player: paused...')
+
+            A = cv2.waitKey(WAITING_KEY)
+            while A != ENTER_KEY:
+                if A == ord('q'):
+                    QUIT = True
+                    break
+                if A == ord('f'):
+                    # Mode full screen
+                    FULL_SCREEN = toggle_full_screen(FULL_SCREEN)
+                if A & 0xFF == ARROW_RIGHT:
+                    # skip animation
+                    current_pause_index = np.min([len(pause_ms)-1, current_pause_index+1])
+                    jump(current_pause_index)
+                if A & 0xFF == ARROW_LEFT:
+                    # previous animation
+                    current_pause_index = np.max([0, current_pause_index-1])
+                    jump(current_pause_index)
+
+                if A != -1:
+                    print(f'You pressed {A}, you have to press ENTER to continue')
                     cv2.imshow(NAME_WINDOW, frame)
- 
+                A = cv2.waitKey(WAITING_KEY)
+                show_seeked()
+
+            print('Manim player: resuming...')
+            current_pause_index += 1
+            clock = None # The pause does not count as playback time
+            continue
+
+        handle_key(cv2.waitKey(1))
+
     # Deallocate structures
+    reader.stop()
     cap.release()
     cv2.destroyAllWindows()
 
 # Call the function on the video:
-video_player(NAME_VIDEO)
\ No newline at end of file
+video_player(NAME_VIDEO)
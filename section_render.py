@@ -0,0 +1,133 @@
+"""
+Section-parallel rendering
+Renders each \\section of a presentation as its own scene in a separate
+process, then joins the videos with a stream-copy concat (no re-encoding)
+and merges their checkpoints
+
+Usage: python section_render.py main.py MyPresentation -j 8 -q l
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import argparse
+import importlib.util
+import pickle
+import shutil
+import subprocess
+
+from manim import config, tempconfig
+
+from tex_parser import split_sections
+
+
+QUALITIES = {
+    "l": "low_quality",
+    "m": "medium_quality",
+    "h": "high_quality",
+    "p": "production_quality",
+    "k": "fourk_quality",
+}
+
+# Output of a section: movie file, pause times, checkpoints and duration
+SectionResult = Tuple[str, List[int], List[float], float]
+
+
+def ffmpeg_executable() -> str:
+    """ffmpeg of manim's config (manim < 0.19), else the one on the PATH"""
+    return getattr(config, "ffmpeg_executable", None) or shutil.which("ffmpeg") or "ffmpeg"
+
+
+def load_scene_class(scene_file: str, scene_name: str) -> type:
+    spec = importlib.util.spec_from_file_location(Path(scene_file).stem, scene_file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, scene_name)
+
+
+def render_sections(scene_file: str, scene_name: str, max_workers: Optional[int] = None,
+                    config_overrides: Optional[Dict] = None) -> str:
+    """Render a TexToManimScene subclass one section per process and return
+    the path of the joined video. Pause times and checkpoints of the whole
+    video are saved as a single render would (times.pkl, checkpoints.pkl)."""
+    config_overrides = config_overrides or {}
+    scene_class = load_scene_class(scene_file, scene_name)
+    with tempconfig(config_overrides):
+        sections = split_sections(scene_class().parser.parse())
+    if not sections:
+        raise Exception(f"No element to render in {scene_name}")
+
+    # Longest sections first, so that the last one to finish is a short one
+    order = sorted(range(len(sections)), key=lambda index: -len(sections[index]))
+    results: Dict[int, SectionResult] = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            index: pool.submit(_render_section, scene_file, scene_name, index, config_overrides)
+            for index in order
+        }
+        for index, future in futures.items():
+            results[index] = future.result()
+            print(f"Section {index + 1}/{len(sections)} rendered: {results[index][0]}")
+
+    movies = [results[index][0] for index in range(len(sections))]
+    output = str(Path(movies[0]).with_name(f"{scene_name}{Path(movies[0]).suffix}"))
+    concat_videos(movies, output)
+    pause_times, checkpoints = merge_times([results[index] for index in range(len(sections))])
+    with open("times.pkl", 'wb') as f:
+        pickle.dump(pause_times, f)
+    with open("checkpoints.pkl", 'wb') as f:
+        pickle.dump(checkpoints, f)
+    return output
+
+
+def _render_section(scene_file: str, scene_name: str, index: int, config_overrides: Dict) -> SectionResult:
+    """Worker of render_sections"""
+    scene_class = load_scene_class(scene_file, scene_name)
+    # Partial movies (and their concat list) are per scene class: one folder per section
+    partial_movie_dir = f"{{video_dir}}/partial_movie_files/{{scene_name}}/section{index:03d}"
+    with tempconfig({**config_overrides, "output_file": f"{scene_name}_section{index:03d}",
+                     "partial_movie_dir": partial_movie_dir}):
+        scene = scene_class(section=index)
+        scene.render()
+        return (str(scene.renderer.file_writer.movie_file_path), scene.pause_times,
+                scene.checkpoints, scene.scene_time)
+
+
+def merge_times(results: List[SectionResult]) -> Tuple[List[int], List[float]]:
+    """Pause times and checkpoints of the joined video. Every section starts
+    at 0, where the previous one ends."""
+    pause_times, checkpoints = [0], [0]
+    offset = 0.0
+    for _, section_pauses, section_checkpoints, duration in results:
+        pause_offset = pause_times[-1]
+        pause_times.extend(pause_offset + pause for pause in section_pauses[1:])
+        checkpoints.extend(offset + checkpoint for checkpoint in section_checkpoints[1:])
+        offset += duration
+    return pause_times, checkpoints
+
+
+def concat_videos(movies: List[str], output: str):
+    """Join videos with the same encoding settings without re-encoding"""
+    list_file = Path(output).with_suffix(".concat.txt")
+    with open(list_file, 'w', encoding='utf-8') as f:
+        for movie in movies:
+            escaped = str(Path(movie).resolve()).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    subprocess.run(
+        [ffmpeg_executable(), "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", str(list_file),
+         "-c", "copy", output],
+        check=True
+    )
+    list_file.unlink()
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Render each section of a presentation in parallel")
+    arguments.add_argument("scene_file", help="Python file defining the scene, e.g. main.py")
+    arguments.add_argument("scene_name", help="TexToManimScene subclass, e.g. MyPresentation")
+    arguments.add_argument("-j", "--workers", type=int, default=None, help="Processes (default: one per core)")
+    arguments.add_argument("-q", "--quality", choices=QUALITIES, default=None, help="Manim quality flag")
+    args = arguments.parse_args()
+
+    overrides = {"quality": QUALITIES[args.quality]} if args.quality else {}
+    print(f"Video: {render_sections(args.scene_file, args.scene_name, args.workers, overrides)}")
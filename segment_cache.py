@@ -0,0 +1,94 @@
+"""
+Animation segment reuse
+Names the partial movie file of every play call after a fingerprint of the
+element being rendered, so that manim reuses the segments of the elements
+that did not change since the last run
+"""
+
+from contextlib import contextmanager
+from dataclasses import fields, is_dataclass
+from pathlib import Path
+from typing import Iterator
+import hashlib
+import sys
+
+import manim
+import numpy as np
+from manim import DR, UL, config
+from manim.renderer import cairo_renderer
+
+from tex_parser import TexElement
+
+
+# Settings of the config that change the frames
+FRAME_SETTINGS = ("pixel_width", "pixel_height", "frame_rate", "frame_width", "frame_height",
+                  "background_color", "background_opacity")
+
+
+def fingerprint(*parts) -> str:
+    return hashlib.sha256("\0".join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def content_key(element: TexElement) -> str:
+    """Content of an element and of its sub-elements, without line numbers"""
+    if not is_dataclass(element):
+        element = element.materialize()  # Compact elements
+    values = []
+    for element_field in fields(element):
+        if element_field.name == 'line_number':
+            continue
+        value = getattr(element, element_field.name)
+        if isinstance(value, list) and value and isinstance(value[0], TexElement):
+            value = [content_key(sub_element) for sub_element in value]
+        values.append((element_field.name, value))
+    return repr(values)
+
+
+def config_key(scene) -> str:
+    """Everything besides the document that changes the partial movies:
+    manim settings and version, renderer code, frame layout, preamble and
+    the keyframes requested from the encoder"""
+    sources = {getattr(sys.modules.get(cls.__module__), '__file__', None) for cls in type(scene).__mro__
+               if not cls.__module__.startswith(('builtins', 'manim'))}
+    code = [hashlib.sha256(Path(source).read_bytes()).hexdigest() for source in sorted(sources - {None})]
+    return fingerprint(
+        manim.__version__, *(config[name] for name in FRAME_SETTINGS), *code,
+        scene.TEXT_COLOR, scene.FRAME_TEXT_WIDTH, scene.FRAME_TEXT_HEIGHT,
+        scene.parser.load_document().preamble_hash,
+        scene.KEYFRAMES_AT_CHECKPOINTS, scene.KEYFRAME_WINDOW, scene.KEYFRAME_INTERVAL, scene.KEYFRAME_GOP,
+    )
+
+
+def layout_key(scene) -> str:
+    """Layout inputs of the next element: where the last one ended and what
+    is left on screen"""
+    parts = [bounds(scene.get_last_position()), len(scene.text_mobjects)]
+    if scene.text_mobjects:
+        parts.append(bounds(scene.text_mobjects))
+    return fingerprint(*parts)
+
+
+def bounds(mobject) -> bytes:
+    return np.round(np.concatenate([mobject.get_corner(UL), mobject.get_corner(DR)]), 4).tobytes()
+
+
+def play_hash(scene, camera, animations, mobjects) -> str:
+    """Hash of a play call: the fingerprint of the element being rendered
+    and the rank of the call in it, or manim's own hash outside elements"""
+    if getattr(scene, 'play_fingerprint', None) is None:
+        return _manim_play_hash(scene, camera, animations, mobjects)
+    scene.play_index += 1
+    return fingerprint(scene.play_fingerprint, scene.play_index)[:32]
+
+
+_manim_play_hash = cairo_renderer.get_hash_from_play_call
+
+
+@contextmanager
+def installed() -> Iterator[None]:
+    """Hash the play calls of TexToManimScene by element fingerprint"""
+    cairo_renderer.get_hash_from_play_call = play_hash
+    try:
+        yield
+    finally:
+        cairo_renderer.get_hash_from_play_call = _manim_play_hash
@@ -0,0 +1,84 @@
+"""
+Slide frames
+Still images of a presentation at its checkpoints or at source lines,
+without rendering the video: each frame is laid out with skipped animations
+and rasterized alone (see TexToManimScene.render_frame), in a process pool.
+For thumbnails and handouts.
+
+Usage: python slide_frames.py main.py MyPresentation --all -j 8 -q h -o frames
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+import argparse
+
+import numpy as np
+from manim import tempconfig
+from PIL import Image
+
+from section_render import QUALITIES, load_scene_class
+
+
+def render_frame(scene_file: str, scene_name: str, checkpoint: Optional[int] = None, line: Optional[int] = None,
+                 config_overrides: Optional[Dict] = None) -> np.ndarray:
+    """Pixels of one frame of a TexToManimScene subclass"""
+    scene_class = load_scene_class(scene_file, scene_name)
+    with tempconfig({**(config_overrides or {}), "preview": False}):
+        return scene_class().render_frame(checkpoint, line)
+
+
+def count_checkpoints(scene_file: str, scene_name: str, config_overrides: Optional[Dict] = None) -> int:
+    """Checkpoints of the presentation, from a dry run (which also fills the
+    LaTeX cache for the workers)"""
+    scene_class = load_scene_class(scene_file, scene_name)
+    with tempconfig({**(config_overrides or {}), "preview": False}):
+        scene = scene_class(dry_run=True)
+        scene.render()
+        return len(scene.checkpoints)
+
+
+def _save_frame(scene_file: str, scene_name: str, checkpoint: Optional[int], line: Optional[int],
+                config_overrides: Dict, path: str) -> str:
+    """Worker of render_frames"""
+    Image.fromarray(render_frame(scene_file, scene_name, checkpoint, line, config_overrides)).save(path)
+    return path
+
+
+def render_frames(scene_file: str, scene_name: str, checkpoints: Sequence[int] = (), lines: Sequence[int] = (),
+                  output_dir: str = "frames", max_workers: Optional[int] = None,
+                  config_overrides: Optional[Dict] = None) -> List[str]:
+    """PNG files of the frames at checkpoints (checkpoint_NNN.png) and at
+    lines of the main file (line_NNNN.png), rendered in parallel"""
+    config_overrides = config_overrides or {}
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    jobs = [(checkpoint, None, str(Path(output_dir) / f"checkpoint_{checkpoint:03d}.png")) for checkpoint in checkpoints]
+    jobs += [(None, line, str(Path(output_dir) / f"line_{line:04d}.png")) for line in lines]
+    # The last frames take longest to lay out: start them first
+    jobs.sort(key=lambda job: -(job[0] if job[0] is not None else job[1]))
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(_save_frame, scene_file, scene_name, checkpoint, line, config_overrides, path)
+                   for checkpoint, line, path in jobs]
+        paths = [future.result() for future in futures]
+    return sorted(paths)
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Render still frames of a presentation")
+    arguments.add_argument("scene_file", help="Python file defining the scene, e.g. main.py")
+    arguments.add_argument("scene_name", help="TexToManimScene subclass, e.g. MyPresentation")
+    arguments.add_argument("--checkpoints", type=int, nargs="*", default=[], help="Checkpoint indices (0: empty screen)")
+    arguments.add_argument("--lines", type=int, nargs="*", default=[], help="Lines of the main .tex file")
+    arguments.add_argument("--all", action="store_true", help="Every checkpoint")
+    arguments.add_argument("-j", "--workers", type=int, default=None, help="Processes (default: one per core)")
+    arguments.add_argument("-q", "--quality", choices=QUALITIES, default=None, help="Manim quality flag")
+    arguments.add_argument("-o", "--output", default="frames", help="Folder of the PNG files")
+    args = arguments.parse_args()
+
+    overrides = {"quality": QUALITIES[args.quality]} if args.quality else {}
+    checkpoints = list(args.checkpoints)
+    if args.all:
+        checkpoints = list(range(count_checkpoints(args.scene_file, args.scene_name, overrides)))
+    for path in render_frames(args.scene_file, args.scene_name, checkpoints, args.lines, args.output,
+                              args.workers, overrides):
+        print(path)
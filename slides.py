@@ -0,0 +1,79 @@
+"""
+Per-slide output
+Splits a rendered video at its checkpoints into one small file per slide
+(pause to pause), described by a manifest.json next to them, so that a
+player can load the slides lazily and a changed slide can be replaced alone
+"""
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import List, Sequence, Tuple
+import json
+import subprocess
+
+from section_render import ffmpeg_executable
+
+
+MANIFEST = "manifest.json"
+
+
+@dataclass
+class Slide:
+    """A pause-to-pause segment of the video"""
+    index: int
+    file: str  # Relative to the manifest
+    start: float  # Seconds of the whole video
+    duration: float
+    element: str  # Type of the element ending the slide
+    source: str  # file:line of that element
+
+
+def split_slides(movie: str, checkpoints: Sequence[float], sources: Sequence[Tuple[str, str]], total: float,
+                 output_dir: str, copy: bool = True) -> List[Slide]:
+    """Write one file per slide of movie into output_dir, with the manifest.
+    sources holds the (element, source) that recorded each checkpoint after
+    the first; the last slide runs to the end of the video. With copy, the
+    video must have keyframes at the checkpoints, as a manim render has
+    (see keyframes.py), else it is re-encoded with them."""
+    output = Path(output_dir)
+    output.mkdir(parents=True, exist_ok=True)
+    suffix = Path(movie).suffix
+    for old in output.glob(f"slide*{suffix}"):
+        old.unlink()
+
+    # Time and label of each cut, the last label of checkpoints recorded at the same time
+    marks: List[Tuple[float, str, str]] = []
+    for time, (element, source) in zip(checkpoints[1:], sources):
+        if marks and time - marks[-1][0] < 1e-6:
+            marks[-1] = (marks[-1][0], element, source)
+        elif 0 < time < total:
+            marks.append((time, element, source))
+    bounds = [time for time, _, _ in marks]
+    cuts = ",".join(f"{time:.6f}" for time in bounds)
+    command = [ffmpeg_executable(), "-y", "-loglevel", "error", "-i", str(movie)]
+    if copy or not bounds:
+        command += ["-c", "copy"]
+    else:
+        command += ["-c:v", "libx264", "-pix_fmt", "yuv420p", "-force_key_frames", cuts, "-c:a", "copy"]
+    if bounds:
+        command += ["-f", "segment", "-segment_times", cuts, "-reset_timestamps", "1",
+                    str(output / f"slide%03d{suffix}")]
+    else:
+        command += [str(output / f"slide000{suffix}")]
+    subprocess.run(command, check=True)
+
+    starts = [0.0] + bounds
+    ends = bounds + [total]
+    labels = [(element, source) for _, element, source in marks] + [("end", "")]
+    slides = [
+        Slide(index, f"slide{index:03d}{suffix}", start, end - start, *label)
+        for index, (start, end, label) in enumerate(zip(starts, ends, labels))
+    ]
+    with open(output / MANIFEST, 'w', encoding='utf-8') as f:
+        json.dump({"slides": [asdict(slide) for slide in slides], "duration": total}, f, indent=1)
+    return slides
+
+
+def load_manifest(output_dir: str) -> List[Slide]:
+    with open(Path(output_dir) / MANIFEST, encoding='utf-8') as f:
+        return [Slide(**slide) for slide in json.load(f)["slides"]]
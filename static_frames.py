@@ -0,0 +1,69 @@
+"""
+Static-frame fast path
+Cairo renderer that rasterizes the first frame of a hold (a Wait inside a
+Succession, with nothing updating) and sends the same frame to the encoder
+for the rest of it instead of redrawing the scene. manim freezes a Wait
+played alone by itself (is_static_wait), but renders the Waits of a
+Succession frame by frame: those are the holds of the coalesced animations
+of TexToManimScene.schedule().
+"""
+
+from typing import List, Optional
+
+import numpy as np
+from manim import Animation, Succession, Wait
+from manim.renderer.cairo_renderer import CairoRenderer
+
+
+def active_animations(animations: List[Animation]) -> List[Optional[Animation]]:
+    """Animations running at the current time of a play call, inside the
+    Successions"""
+    active = []
+    for animation in animations:
+        while isinstance(animation, Succession):
+            animation = getattr(animation, 'active_animation', None)
+        active.append(animation)
+    return active
+
+
+def has_updaters(scene) -> bool:
+    """Whether something can move during a Wait"""
+    return bool(scene.always_update_mobjects or scene.updaters or any(
+        mobject.has_time_based_updater() for mobject in scene.get_mobject_family_members()
+    ))
+
+
+class HoldingRenderer(CairoRenderer):
+    """CairoRenderer drawing every held frame once"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.held_frame: Optional[np.ndarray] = None
+        self.scene_moves: Optional[bool] = None  # Updaters in the current play call
+        self.held_frames = 0  # Frames not rasterized
+
+    def play(self, scene, *args, **kwargs):
+        self.held_frame, self.scene_moves = None, None
+        super().play(scene, *args, **kwargs)
+
+    def holding(self, scene) -> bool:
+        if not getattr(scene, 'HOLD_STATIC_FRAMES', True):
+            return False
+        if not all(isinstance(animation, Wait) for animation in active_animations(scene.animations)):
+            return False
+        if self.scene_moves is None:
+            self.scene_moves = has_updaters(scene)
+        return not self.scene_moves
+
+    def render(self, scene, time, moving_mobjects):
+        if not self.holding(scene):
+            self.held_frame = None
+            super().render(scene, time, moving_mobjects)
+            return
+        if self.held_frame is None:
+            # First frame of the hold: the animations before it are finished
+            self.update_frame(scene, moving_mobjects)
+            self.held_frame = self.get_frame()
+        else:
+            self.held_frames += 1
+        self.add_frame(self.held_frame)
@@ -0,0 +1,165 @@
+"""
+Persistent LaTeX snippet cache
+Content-addressed store of the SVG files produced by latex + dvisvgm, shared
+across runs, checkouts and machines (point several builds at the same folder)
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+
+from manim import config
+from manim.mobject.text import tex_mobject
+from manim.utils import tex_file_writing
+
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "MANIM_TEX_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "manim_player", "tex")
+)
+
+
+class SnippetCache:
+    """Compiled snippets keyed by their full LaTeX source
+
+    The key hashes the TeX file manim would compile: the snippet, its tex
+    environment and the whole TexTemplate (preamble included), plus the
+    compiler and output format. Entries are evicted least recently used
+    first once the folder exceeds max_bytes. The counters and the size are
+    kept under a lock: compile_ahead stores from a background thread while
+    the render reads.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = 512 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._size: Optional[int] = None  # Bytes in the folder, scanned on first store
+        self._lock = threading.Lock()  # Guards the counters and _size
+
+    def key(self, expression: str, environment: Optional[str] = None, tex_template=None) -> str:
+        tex_template = tex_template or config.tex_template
+        if environment is not None:
+            source = tex_template.get_texcode_for_expression_in_env(expression, environment)
+        else:
+            source = tex_template.get_texcode_for_expression(expression)
+        key = "\0".join((source, tex_template.tex_compiler, tex_template.output_format))
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    def contains(self, key: str, count_miss: bool = False) -> bool:
+        """Whether a key is stored, without counting a hit. With count_miss,
+        a key not stored counts as a miss: the caller compiles it (batch)."""
+        if self._path(key).exists():
+            return True
+        if count_miss:
+            with self._lock:
+                self.misses += 1
+        return False
+
+    def get(self, key: str) -> Optional[Path]:
+        """Stored SVG of a key, None on a miss"""
+        path = self._path(key)
+        try:
+            os.utime(path)  # Recently used
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def put(self, key: str, svg_file: Path) -> Path:
+        """Store a compiled SVG, atomically so that concurrent builds can share the folder"""
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+        shutil.copyfile(svg_file, tmp)
+        os.replace(tmp, path)
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += path.stat().st_size
+            if self._size > self.max_bytes:
+                self._evict()
+        return path
+
+    def evict(self, target: float = 0.9):
+        """Delete least recently used entries until the folder is below
+        target * max_bytes"""
+        with self._lock:
+            self._evict(target)
+
+    def _evict(self, target: float = 0.9):
+        entries = []
+        for path in Path(self.cache_dir).glob("*/*.svg"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue  # Evicted by another build
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= target * self.max_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            self._size -= size
+            self.evictions += 1
+
+    def tex_to_svg_file(self, expression: str, environment: Optional[str] = None, tex_template=None) -> Path:
+        """Drop-in replacement of manim's tex_to_svg_file going through the cache"""
+        key = self.key(expression, environment, tex_template)
+        local = Path(config.get_dir("tex_dir")) / f"{key}.svg"
+        if local.exists():
+            with self._lock:
+                self.hits += 1
+            return local
+
+        stored = self.get(key)
+        if stored is None:
+            svg_file = tex_file_writing.tex_to_svg_file(expression, environment, tex_template)
+            self.put(key, svg_file)
+            return svg_file
+
+        # Local copy, so that an eviction by another build cannot remove it while in use
+        local.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(stored, local)
+        return local
+
+    @contextmanager
+    def installed(self) -> Iterator['SnippetCache']:
+        """Route the Tex and MathTex compilations through the cache"""
+        original = tex_mobject.tex_to_svg_file
+        tex_mobject.tex_to_svg_file = self.tex_to_svg_file
+        try:
+            yield self
+        finally:
+            tex_mobject.tex_to_svg_file = original
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+    def _path(self, key: str) -> Path:
+        return Path(self.cache_dir) / key[:2] / f"{key}.svg"
+
+    def _scan_size(self) -> int:
+        total = 0
+        for path in Path(self.cache_dir).glob("*/*.svg"):
+            try:
+                total += path.stat().st_size
+            except OSError:
+                pass
+        return total
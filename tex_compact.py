@@ -0,0 +1,282 @@
+"""
+Compact element representation
+Elements with __slots__ that keep byte offsets into a memory-mapped source
+file and build their strings only when they are accessed
+"""
+
+from abc import ABC, abstractmethod
+from array import array
+from typing import Iterable, Iterator, List, Optional, Tuple
+import mmap
+
+from tex_parser import (
+    TexParser, DocumentModel, ElementType, ParserState, TexElement, TextElement, EquationElement,
+    AlignElement, TheoremLikeElement, ProofElement, SectionElement, THEOREM_TYPE_MAP
+)
+
+
+Span = Tuple[int, int]  # (start, end) byte offsets in the source buffer
+
+
+class SourceBuffer:
+    """Read-only memory map of a LaTeX file, with the flat tables the
+    compact elements point into
+
+    Each element owns a record: its line number and a run of consecutive
+    spans, which ends where the spans of the next record start.
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            try:
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                self.buffer = b''  # Empty files cannot be mapped
+        self.record_lines = array('L')
+        self.record_first_span = array('L')
+        self.span_starts = array('Q')
+        self.span_ends = array('Q')
+
+    def add_record(self, line_number: int, spans: Iterable[Span] = ()) -> int:
+        """Store a record and return its index"""
+        self.record_lines.append(line_number)
+        self.record_first_span.append(len(self.span_starts))
+        for start, end in spans:
+            self.span_starts.append(start)
+            self.span_ends.append(end)
+        return len(self.record_lines) - 1
+
+    def record_texts(self, record: int) -> Iterator[str]:
+        """Decoded text of each span of a record"""
+        first = self.record_first_span[record]
+        if record + 1 < len(self.record_first_span):
+            last = self.record_first_span[record + 1]
+        else:
+            last = len(self.span_starts)
+        for index in range(first, last):
+            yield self.text(self.span_starts[index], self.span_ends[index])
+
+    def text(self, start: int, end: int) -> str:
+        """Decoded text between two byte offsets. Windows line endings are
+        read as newlines; a lone carriage return is not a line break."""
+        return self.buffer[start:end].decode('utf-8').replace('\r\n', '\n')
+
+    def iter_lines(self, offset: int = 0) -> Iterator[Span]:
+        """Spans of the lines starting at offset, newline included"""
+        end = len(self.buffer)
+        while offset < end:
+            newline = self.buffer.find(b'\n', offset)
+            stop = end if newline < 0 else newline + 1
+            yield offset, stop
+            offset = stop
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+
+class CompactElement(ABC):
+    """Base class of the compact elements: a record of a source buffer"""
+    __slots__ = ('source', 'record', 'source_file')
+    element_type: ElementType
+
+    def __init__(self, source: SourceBuffer, record: int):
+        self.source = source
+        self.record = record
+        self.source_file = None
+
+    @property
+    def line_number(self) -> int:
+        return self.source.record_lines[self.record]
+
+    @line_number.setter
+    def line_number(self, value: int):
+        self.source.record_lines[self.record] = value
+
+    @abstractmethod
+    def materialize(self) -> TexElement:
+        """Equivalent regular TexElement"""
+
+    def __repr__(self):
+        return f"Compact{self.materialize()!r}"
+
+
+class CompactTextElement(CompactElement):
+    __slots__ = ()
+    element_type = ElementType.TEXT
+
+    @property
+    def content(self) -> str:
+        return ''.join(self.source.record_texts(self.record)).strip()
+
+    def materialize(self) -> TextElement:
+        return TextElement(element_type=ElementType.TEXT, line_number=self.line_number, content=self.content)
+
+
+class CompactEquationElement(CompactElement):
+    __slots__ = ()
+    element_type = ElementType.EQUATION
+    environment = "equation"
+
+    @property
+    def content(self) -> str:
+        return ''.join(self.source.record_texts(self.record))
+
+    def materialize(self) -> EquationElement:
+        return EquationElement(element_type=ElementType.EQUATION, line_number=self.line_number,
+                               content=self.content, environment=self.environment)
+
+
+class CompactAlignElement(CompactElement):
+    """Align whose rows and full content are both derived from its spans,
+    one per row"""
+    __slots__ = ('directives',)
+    element_type = ElementType.ALIGN
+
+    def __init__(self, source: SourceBuffer, record: int, directives: Optional[Tuple[str, ...]]):
+        super().__init__(source, record)
+        self.directives = directives  # None when every row uses Write
+
+    @property
+    def rows(self) -> List[List[str]]:
+        return [text.split('\\pause') for text in self.source.record_texts(self.record)]
+
+    @property
+    def full_content(self) -> str:
+        return ''.join(text.replace("\\pause", "") for text in self.source.record_texts(self.record))
+
+    @property
+    def align_animations(self) -> List[str]:
+        if self.directives is not None:
+            return list(self.directives)
+        return ["Write"] * sum(1 for _ in self.source.record_texts(self.record))
+
+    def materialize(self) -> AlignElement:
+        return AlignElement(element_type=ElementType.ALIGN, line_number=self.line_number, rows=self.rows,
+                            full_content=self.full_content, align_animations=self.align_animations)
+
+
+class CompactSectionElement(CompactElement):
+    __slots__ = ('title',)
+    element_type = ElementType.SECTION
+
+    def __init__(self, source: SourceBuffer, record: int, title: str):
+        super().__init__(source, record)
+        self.title = title
+
+    def materialize(self) -> SectionElement:
+        return SectionElement(element_type=ElementType.SECTION, line_number=self.line_number, title=self.title)
+
+
+class CompactTheoremLikeElement(CompactElement):
+    __slots__ = ('element_type', 'label', 'content')
+
+    def __init__(self, source: SourceBuffer, record: int, theorem_type: ElementType,
+                 label: Optional[str], content: List[CompactElement]):
+        super().__init__(source, record)
+        self.element_type = theorem_type
+        self.label = label
+        self.content = content
+
+    @property
+    def theorem_type(self) -> ElementType:
+        return self.element_type
+
+    def materialize(self) -> TheoremLikeElement:
+        return TheoremLikeElement(element_type=self.element_type, line_number=self.line_number,
+                                  theorem_type=self.element_type, label=self.label,
+                                  content=[element.materialize() for element in self.content])
+
+
+class CompactProofElement(CompactElement):
+    __slots__ = ('content',)
+    element_type = ElementType.PROOF
+
+    def __init__(self, source: SourceBuffer, record: int, content: List[CompactElement]):
+        super().__init__(source, record)
+        self.content = content
+
+    def materialize(self) -> ProofElement:
+        return ProofElement(element_type=ElementType.PROOF, line_number=self.line_number,
+                            content=[element.materialize() for element in self.content])
+
+
+class CompactTexParser(TexParser):
+    """TexParser producing compact elements over a memory-mapped source
+
+    The source buffer stays mapped as long as elements refer to it. The
+    element cache is not supported: compact elements only make sense with
+    their buffer.
+    """
+
+    def __init__(self, filename: str, **kwargs):
+        if kwargs.get('cache') is not None:
+            raise ValueError("The element cache cannot store compact elements")
+        super().__init__(filename, **kwargs)
+        self.source: Optional[SourceBuffer] = None
+        self.span: Span = (0, 0)  # Span of the line being parsed
+
+    def iter_elements(self) -> Iterator[CompactElement]:
+        try:
+            self.source = SourceBuffer(self.filename)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"LaTeX file not found: {self.filename}")
+        self.document = DocumentModel.from_buffer(self.filename, self.source.buffer)
+        yield from self.iter_lines(self._iter_source_lines(self.document.body_offset), self.document.body_line)
+
+    def _iter_source_lines(self, offset: int) -> Iterator[str]:
+        """Decoded lines of the source, recording the span of each one"""
+        for span in self.source.iter_lines(offset):
+            self.span = span
+            yield self.source.text(*span)
+
+    def _add_section(self, title: str):
+        record = self.source.add_record(self.line_number)
+        self.elements.append(CompactSectionElement(self.source, record, title))
+
+    def _add_text(self, line: str):
+        record = self.source.add_record(self.line_number, (self.span,))
+        self.elements.append(CompactTextElement(self.source, record))
+
+    def _add_equation_line(self, line: str):
+        # Adjacent lines are merged into a single span
+        if self.current_content and self.current_content[-1][1] == self.span[0]:
+            self.current_content[-1] = (self.current_content[-1][0], self.span[1])
+        else:
+            self.current_content.append(self.span)
+
+    def _close_equation(self):
+        record = self.source.add_record(self.line_number, self.current_content)
+        self._add_nested(CompactEquationElement(self.source, record))
+        self._exit_state()
+
+    def _add_align_row(self, line: str, directive):
+        self.current_content.append(self.span)
+        if directive and directive.group(1):
+            self.current_align_animations.append(directive.group(1).strip())
+        else:
+            self.current_align_animations.append("Write")
+
+    def _close_align(self):
+        record = self.source.add_record(self.line_number, self.current_content)
+        directives = None
+        if any(animation != "Write" for animation in self.current_align_animations):
+            directives = tuple(self.current_align_animations)
+        element = CompactAlignElement(self.source, record, directives)
+        if not self.quiet:
+            print(f"ALIGN ROWS : {element.rows}")
+        self._add_nested(element)
+        self.current_align_animations = []
+        self._exit_state()
+
+    def _close_theorem_like(self):
+        record = self.source.add_record(self.line_number)
+        content = self._take_theorem_content()
+        if self.state == ParserState.IN_PROOF:
+            self.elements.append(CompactProofElement(self.source, record, content))
+        else:
+            self.elements.append(CompactTheoremLikeElement(
+                self.source, record, THEOREM_TYPE_MAP[self.state], self.current_label, content
+            ))
+        self._exit_state()
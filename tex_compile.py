@@ -0,0 +1,382 @@
+"""
+Batched LaTeX compilation
+Collects the snippets of a document, compiles them as the pages of a single
+multi-page document and splits it back into one SVG per snippet, so that a
+whole document costs one latex and one dvisvgm run per worker process.
+Optionally, every latex run starts from a format dumped from the preamble
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Collection, Dict, Iterable, Iterator, List, Optional, Tuple
+import hashlib
+import os
+import re
+import subprocess
+import time
+
+from manim import config
+from manim.mobject.text import tex_mobject
+from manim.utils import tex_file_writing
+
+from processes import ProcessCounter
+from tex_cache import SnippetCache
+
+
+# (expression, tex environment, TexTemplate) as passed to tex_to_svg_file
+Snippet = Tuple[str, Optional[str], object]
+
+BATCH_DOCUMENTCLASS = "\\documentclass[preview,multi={manimsnippet}]{standalone}"
+BATCH_PAGE_ENVIRONMENT = "\\newenvironment{manimsnippet}{}{}"
+
+# Compilers able to dump a format with mylatexformat
+FORMAT_COMPILERS = ("latex", "pdflatex", "xelatex")
+
+# Packages that only change the page layout or the PDF output, never a snippet
+LAYOUT_PACKAGES = ("hyperref", "cleveref", "natbib", "tikz", "subfig", "float",
+                   "colortbl", "enumitem", "geometry", "fancyhdr")
+
+# Preamble commands that need a package, dropped with it
+PACKAGE_COMMANDS = {
+    "hyperref": ("\\hypersetup",),
+    "cleveref": ("\\crefname", "\\Crefname"),
+    "tikz": ("\\usetikzlibrary", "\\tikzset"),
+    "enumitem": ("\\setlist",),
+    "geometry": ("\\geometry",),
+    "fancyhdr": ("\\pagestyle", "\\fancyhf", "\\fancyhead", "\\fancyfoot"),
+}
+
+PACKAGE_LINE = re.compile(r'\s*\\(usepackage|RequirePackage)(\[[^\]]*\])?\{([^}]*)\}(.*)', re.S)
+
+# Stand-in returned while recording, so that the mobject can still be built
+PLACEHOLDER_SVG = '<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 10 10"><path d="M0 0H10V10Z"/></svg>'
+
+
+@dataclass
+class TexSpec:
+    """Arguments of a Tex or MathTex call, known before the mobject is built"""
+    mobject_class: type
+    args: tuple
+    kwargs: Dict = field(default_factory=dict)
+
+    def build(self):
+        return self.mobject_class(*self.args, **self.kwargs)
+
+
+def snippets_of(spec: TexSpec) -> List[Snippet]:
+    """Snippets a spec compiles, as prepared by manim, without compiling
+    them. Depending on the manim version, MathTex compiles its isolated
+    substrings too."""
+    placeholder = Path(config.get_dir("tex_dir")) / "placeholder.svg"
+    if not placeholder.exists():
+        placeholder.parent.mkdir(parents=True, exist_ok=True)
+        placeholder.write_text(PLACEHOLDER_SVG)
+
+    snippets = []
+    def record(expression, environment=None, tex_template=None):
+        snippets.append((expression, environment, tex_template or config.tex_template))
+        return placeholder
+
+    original = tex_mobject.tex_to_svg_file
+    tex_mobject.tex_to_svg_file = record
+    try:
+        spec.build()
+    finally:
+        tex_mobject.tex_to_svg_file = original
+    return snippets
+
+
+def compile_batch(specs: Iterable[TexSpec], cache: SnippetCache, max_workers: Optional[int] = 1,
+                  format_dir: Optional[Path] = None, times: Optional[Dict[int, float]] = None) -> int:
+    """Compile every snippet of specs missing from the cache and store the
+    SVGs in the cache. Returns the number of snippets compiled.
+    
+    The snippets of each TexTemplate are split into one chunk per worker
+    process (max_workers=None for one per core), each compiled as a single
+    document. A chunk that fails is compiled one snippet at a time; the
+    snippets that still fail are left to the regular compilation, which
+    reports the LaTeX error when the mobject is built. With a format_dir,
+    the documents are compiled against a precompiled preamble.
+
+    When times is given, it receives the compilation seconds of each spec,
+    by index in specs: the time of a document is split evenly between its
+    pages, and a snippet shared by several specs is charged to the first.
+    """
+    snippets = []
+    first_spec: Dict[str, int] = {}
+    for index, spec in enumerate(specs):
+        for snippet in snippets_of(spec):
+            snippets.append(snippet)
+            if times is not None:
+                first_spec.setdefault(cache.key(*snippet), index)
+    snippet_times = {} if times is not None else None
+    compiled = compile_snippets(snippets, cache, max_workers, format_dir, snippet_times)
+    for key, seconds in (snippet_times or {}).items():
+        times[first_spec[key]] = times.get(first_spec[key], 0.0) + seconds
+    return compiled
+
+
+def compile_ahead(elements: Iterable, specs_of: Callable[[object], Iterable[TexSpec]], cache: SnippetCache,
+                  depth: int = 4, format_dir: Optional[Path] = None) -> Iterator:
+    """Yield elements once their snippets are in the cache, compiling those
+    of the next depth elements in a background thread meanwhile, so that
+    the latex runs overlap with the rendering of the current element.
+    The snippets are collected here: snippets_of patches manim globally."""
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        for element in elements:
+            snippets = [snippet for spec in specs_of(element) for snippet in snippets_of(spec)]
+            pending.append((element, pool.submit(compile_snippets, snippets, cache, 1, format_dir)))
+            if len(pending) > depth:
+                element, compiled = pending.popleft()
+                compiled.result()
+                yield element
+        while pending:
+            element, compiled = pending.popleft()
+            compiled.result()
+            yield element
+
+
+def compile_snippets(snippets: Iterable[Snippet], cache: SnippetCache, max_workers: Optional[int] = 1,
+                     format_dir: Optional[Path] = None, times: Optional[Dict[str, float]] = None) -> int:
+    """compile_batch of collected snippets, with the seconds of each
+    compiled one by cache key in times. Only runs processes and file
+    operations, so that it can run in a background thread."""
+    groups: Dict[int, Dict[str, Snippet]] = {}
+    seen = set()
+    for snippet in snippets:
+        if not snippet[0].strip():
+            continue  # Would be an empty page
+        key = cache.key(*snippet)
+        if key not in seen and not cache.contains(key, count_miss=True):
+            groups.setdefault(id(snippet[2]), {})[key] = snippet
+        seen.add(key)
+
+    workers = max_workers or os.cpu_count()
+    chunks = []
+    for missing in groups.values():
+        items = list(missing.items())
+        count = min(len(items), workers)
+        chunks.extend(items[i::count] for i in range(count))
+
+    work_root = Path(config.get_dir("tex_dir")) / "batch"
+    roots, format_dirs = [work_root] * len(chunks), [format_dir] * len(chunks)
+    if workers == 1 or len(chunks) < 2:
+        # Launches counted in this process already
+        return sum(_store_pages(cache, pages, times) for pages, _ in map(_compile_chunk, chunks, roots, format_dirs))
+    compiled = 0
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+        for pages, commands in pool.map(_compile_chunk, chunks, roots, format_dirs):
+            for command in commands:
+                ProcessCounter.launched(command)  # Run by the worker process
+            compiled += _store_pages(cache, pages, times)
+    return compiled
+
+
+def _store_pages(cache: SnippetCache, pages: List[Tuple[str, Path, float]],
+                 times: Optional[Dict[str, float]] = None) -> int:
+    for key, page, seconds in pages:
+        cache.put(key, page)
+        if times is not None:
+            times[key] = seconds
+    return len(pages)
+
+
+def _compile_chunk(items: List[Tuple[str, Snippet]], work_root: Path,
+                   format_dir: Optional[Path]) -> Tuple[List[Tuple[str, Path, float]], list]:
+    """Worker of compile_batch: (key, SVG, seconds) of the snippets of a
+    chunk that compile, and the commands it launched"""
+    with ProcessCounter() as launches:
+        pages = _compile_items(items, work_root, format_dir)
+    return pages, launches.commands
+
+
+def _compile_items(items: List[Tuple[str, Snippet]], work_root: Path,
+                   format_dir: Optional[Path]) -> List[Tuple[str, Path, float]]:
+    start = time.perf_counter()
+    if len(items) > 1:
+        try:
+            pages = compile_pages([snippet for _, snippet in items], work_root, format_dir)
+            seconds = (time.perf_counter() - start) / len(items)
+            return [(key, page, seconds) for (key, _), page in zip(items, pages)]
+        except Exception as e:
+            print(f"Warning: batch LaTeX compilation failed, compiling one by one: {e}")
+    failed = (time.perf_counter() - start) / len(items)  # The failed document, split evenly
+
+    pages = []
+    for key, (expression, environment, tex_template) in items:
+        start = time.perf_counter()
+        try:
+            pages.append((key, tex_file_writing.tex_to_svg_file(expression, environment, tex_template),
+                          failed + time.perf_counter() - start))
+        except Exception:
+            continue  # Reported when the mobject is built
+    return pages
+
+
+def compile_pages(snippets: List[Snippet], work_root: Path, format_dir: Optional[Path] = None) -> List[Path]:
+    """Compile snippets sharing a TexTemplate as one multi-page document and
+    return the SVG of each page"""
+    tex_template = snippets[0][2]
+    preamble, bodies = None, []
+    for expression, environment, _ in snippets:
+        if environment is not None:
+            source = tex_template.get_texcode_for_expression_in_env(expression, environment)
+        else:
+            source = tex_template.get_texcode_for_expression(expression)
+        head, body = source.split("\\begin{document}", 1)
+        preamble = preamble or head
+        bodies.append(body.rsplit("\\end{document}", 1)[0])
+
+    preamble = re.sub(r"\\documentclass(\[[^\]]*\])?\{[^}]*\}",
+                      lambda _: BATCH_DOCUMENTCLASS, preamble, count=1)
+    document = "\n".join(
+        [preamble, "\\begin{document}", BATCH_PAGE_ENVIRONMENT]
+        + [f"\\begin{{manimsnippet}}{body}\\end{{manimsnippet}}" for body in bodies]
+        + ["\\end{document}\n"]
+    )
+
+    name = hashlib.sha256(document.encode('utf-8')).hexdigest()[:16]
+    work_dir = work_root / name
+    work_dir.mkdir(parents=True, exist_ok=True)
+    tex_file = work_dir / "batch.tex"
+    tex_file.write_text(document, encoding='utf-8')
+
+    fmt = dump_format(preamble, tex_template.tex_compiler, format_dir) if format_dir else None
+    subprocess.run(latex_command(tex_template, tex_file, work_dir, fmt), check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    output = tex_file.with_suffix(tex_template.output_format)
+    subprocess.run(dvisvgm_command(tex_template, output, work_dir), check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    pages = sorted(work_dir.glob("page-*.svg"), key=lambda path: int(path.stem.split("-")[1]))
+    if len(pages) != len(snippets):
+        raise Exception(f"{len(pages)} pages produced for {len(snippets)} snippets")
+    return pages
+
+
+def latex_command(tex_template, tex_file: Path, work_dir: Path, fmt: Optional[Path] = None) -> List[str]:
+    """TeX compiler call for tex_file, with the options manim uses"""
+    compiler, output_format = tex_template.tex_compiler, tex_template.output_format
+    command = [compiler, "-interaction=batchmode", "-halt-on-error", f"-output-directory={work_dir}"]
+    if fmt is not None:
+        command.append(f"-fmt={fmt.with_suffix('')}")
+    if compiler in ("latex", "pdflatex", "luatex", "lualatex"):
+        command.append(f"-output-format={output_format[1:]}")
+    elif compiler == "xelatex" and output_format == ".xdv":
+        command.append("-no-pdf")
+    elif compiler != "xelatex":
+        raise ValueError(f"Unsupported TeX compiler for batch compilation: {compiler}")
+    return command + [str(tex_file)]
+
+
+def dvisvgm_command(tex_template, output: Path, work_dir: Path) -> List[str]:
+    """dvisvgm call writing every page of output as page-<n>.svg"""
+    command = ["dvisvgm", "--page=1-", "--no-fonts", "--verbosity=0",
+               f"--output={os.path.join(work_dir, 'page-%p.svg')}"]
+    if tex_template.output_format == ".pdf":
+        command.append("--pdf")
+    return command + [str(output)]
+
+
+def dump_format(preamble: str, compiler: str, format_dir: Path) -> Optional[Path]:
+    """Format file of a preamble, dumped with mylatexformat on first use.
+    None if the compiler or the preamble cannot be dumped."""
+    if compiler not in FORMAT_COMPILERS:
+        return None
+    name = "preamble_" + hashlib.sha256(f"{compiler}\0{preamble}".encode('utf-8')).hexdigest()[:16]
+    fmt = format_dir / f"{name}.fmt"
+    if fmt.exists():
+        return fmt
+    if (format_dir / f"{name}.failed").exists():
+        return None
+
+    # Dumped under a name of its own, so that concurrent dumps do not collide
+    format_dir.mkdir(parents=True, exist_ok=True)
+    job = f"{name}_{os.getpid()}"
+    source = format_dir / f"{job}.tex"
+    source.write_text(preamble + "\\begin{document}\\end{document}\n", encoding='utf-8')
+    result = subprocess.run(
+        [compiler, "-ini", "-interaction=batchmode", "-halt-on-error", f"-jobname={job}",
+         f"-output-directory={format_dir}", f"&{compiler}", "mylatexformat.ltx", str(source)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    if result.returncode != 0 or not (format_dir / f"{job}.fmt").exists():
+        print(f"Warning: could not dump a LaTeX format of the preamble, see {format_dir / job}.log")
+        (format_dir / f"{name}.failed").touch()
+        return None
+    os.replace(format_dir / f"{job}.fmt", fmt)
+    return fmt
+
+
+@contextmanager
+def precompiled_format(format_dir: Path) -> Iterator[None]:
+    """Compile the snippets manim compiles one by one against the format of
+    their preamble. Needs manim < 0.19 (tex_compilation_command), else they
+    are compiled normally; the batch uses the format either way."""
+    if not hasattr(tex_file_writing, "tex_compilation_command"):
+        print("Warning: precompiled format not supported by this manim version (needs manim < 0.19), "
+              "snippets outside the batch are compiled normally")
+        yield
+        return
+    original = tex_file_writing.tex_compilation_command
+
+    def command(tex_compiler, output_format, tex_file, tex_dir):
+        compilation = original(tex_compiler, output_format, tex_file, tex_dir)
+        preamble = Path(tex_file).read_text(encoding='utf-8').split("\\begin{document}", 1)[0]
+        fmt = dump_format(preamble, tex_compiler, format_dir)
+        if fmt is None:
+            return compilation
+        option = f"-fmt={fmt.with_suffix('')}"
+        if isinstance(compilation, str):
+            return compilation.replace(tex_compiler, f"{tex_compiler} {option}", 1)
+        return [compilation[0], option, *compilation[1:]]
+
+    tex_file_writing.tex_compilation_command = command
+    try:
+        yield
+    finally:
+        tex_file_writing.tex_compilation_command = original
+
+
+def prune_preamble(lines: Iterable[str], deny: Collection[str] = LAYOUT_PACKAGES,
+                   allow: Optional[Collection[str]] = None) -> List[str]:
+    """Preamble lines without the packages of deny, or only with those of
+    allow when given, and without the setup commands of removed packages
+    (up to the brace closing their last argument, which may be on a later line)"""
+    removed = set()
+    pruned = []
+    depth, awaiting = 0, False  # Open braces of a dropped command, dropped command without its argument yet
+    for line in lines:
+        if depth > 0 or awaiting:
+            opened, closed = _braces(line)
+            depth += opened - closed
+            awaiting = awaiting and not opened
+            continue
+        if match := PACKAGE_LINE.match(line):
+            command, options, names, rest = match.groups()
+            names = [name.strip() for name in names.split(',') if name.strip()]
+            kept = [name for name in names if (name in allow if allow is not None else name not in deny)]
+            removed.update(set(names) - set(kept))
+            if not kept:
+                continue
+            if len(kept) < len(names):
+                line = f"\\{command}{options or ''}{{{','.join(kept)}}}{rest}"
+        elif dropped := next((command for package in removed for command in PACKAGE_COMMANDS.get(package, ())
+                              if re.match(re.escape(command) + r'(?![A-Za-z@])', line.lstrip())), None):
+            arguments = line.lstrip()[len(dropped):]
+            opened, closed = _braces(arguments)
+            depth = opened - closed
+            awaiting = not opened and not arguments.split('%', 1)[0].strip()
+            continue
+        pruned.append(line)
+    return pruned
+
+
+def _braces(line: str) -> Tuple[int, int]:
+    """Unescaped opening and closing braces of a line, before any comment"""
+    line = re.sub(r'\\[\\{}%]', '', line).split('%', 1)[0]
+    return line.count('{'), line.count('}')
@@ -5,19 +5,66 @@ Renders parsed LaTeX elements as Manim animations
 
 from manim import *
 from tex_parser import (
-    TexParser, ElementType, TextElement, EquationElement, 
+    TexParser, ElementType, split_sections, TextElement, EquationElement, 
     AlignElement, TheoremLikeElement, ProofElement, SectionElement
 )
+from element_cache import ElementCache
+from tex_cache import DEFAULT_CACHE_DIR, SnippetCache
+from tex_compile import LAYOUT_PACKAGES, TexSpec, compile_ahead, compile_batch, precompiled_format, prune_preamble
+from viewport import Viewport
+from segment_cache import config_key, content_key, fingerprint, layout_key
+from timeline import Timeline
+from keyframes import ENCODER_PIPE, KeyframeFileWriter, check_encoder_pipe, keyframe_options
+from slides import split_slides
+from static_frames import HoldingRenderer
+from multi_quality import MultiTargetRenderer
+from profiler import Profiler
+import segment_cache
+from pathlib import Path
+import contextlib
+import os
 import pickle
 import re
 
+class FrameReached(Exception):
+    """Raised to stop the construction once the frame asked to render_frame() is laid out"""
+
+
 class TexToManimScene(Scene):
     """Renders parsed LaTeX elements as animations"""
     
-    def __init__(self, latex_filename, **kwargs):
+    # Color and name of the theorem-like environments
+    THEOREM_STYLES = {
+        ElementType.THEOREM: (ORANGE, "Theorem"),
+        ElementType.LEMMA: (GREEN, "Lemma"),
+        ElementType.PROPOSITION: (BLUE, "Proposition"),
+    }
+    
+    # .tex file of a subclass, when not passed to __init__ (readable without building the scene)
+    LATEX_FILENAME = None
+    
+    def __init__(self, latex_filename=None, section=None, dry_run=False, outputs=None, **kwargs):
+        latex_filename = latex_filename or self.LATEX_FILENAME
+        if latex_filename is None:
+            raise Exception(f"No .tex file for {type(self).__name__}: set LATEX_FILENAME or pass latex_filename")
+        if getattr(config.renderer, "value", config.renderer) == "cairo" and kwargs.get("renderer") is None:
+            renderer_options = dict(
+                camera_class=kwargs.get("camera_class", Camera),
+                skip_animations=kwargs.get("skip_animations", False)
+            )
+            # outputs: config overrides of extra videos rendered from the same construction
+            if outputs:
+                kwargs["renderer"] = MultiTargetRenderer(outputs, **renderer_options)
+            else:
+                kwargs["renderer"] = HoldingRenderer(file_writer_class=KeyframeFileWriter, **renderer_options)
         super().__init__(**kwargs)
         self.latex_filename = latex_filename
-        self.parser = TexParser(latex_filename)
+        self.section = section  # Index of the only section to render (see section_render.py)
+        self.parser = TexParser(
+            latex_filename,
+            quiet=True,
+            cache=ElementCache(os.path.join(config.media_dir, "parser_cache"))
+        )
         self.elements = []
         
         # Configuration
@@ -25,38 +72,249 @@ class TexToManimScene(Scene):
         self.FRAME_TEXT_WIDTH = 17
         self.FRAME_TEXT_HEIGHT = 7
         self.FRAME_TEXT_ORIGIN = None  # Set in construct()
+        self.TEX_CACHE_DIR = DEFAULT_CACHE_DIR  # Shared compiled snippets, None to keep them with the media
+        self.TEX_CACHE_MAX_MB = 512
+        self.BATCH_TEX = True  # Compile all the snippets in one latex run before rendering
+        self.TEX_WORKERS = 1  # Processes compiling the batch, None for one per core
+        self.TEX_LOOKAHEAD = 4  # Without BATCH_TEX, elements compiled in the background ahead of rendering
+        self.REUSE_SEGMENTS = True  # Reuse the partial movies of unchanged elements
+        self.MAX_CACHED_SEGMENTS = 10000  # Partial movies kept by manim
+        self.PRECOMPILED_FORMAT = False  # Compile the snippets against a format dumped from the preamble
+        self.PRUNE_PREAMBLE = False  # Drop the packages of PREAMBLE_DENY, or keep only PREAMBLE_ALLOW
+        self.PREAMBLE_DENY = LAYOUT_PACKAGES
+        self.PREAMBLE_ALLOW = None
+        self.DRY_RUN = dry_run  # Lay out and time the video without rendering frames (see timeline.py)
+        self.TIME_BUDGET = None  # Maximum video length in seconds, checked at the end of the document
+        self.KEYFRAMES_AT_CHECKPOINTS = False  # Encode extra keyframes after each checkpoint (see keyframes.py)
+        self.KEYFRAME_WINDOW = 0.0  # Seconds after each checkpoint with extra keyframes
+        self.KEYFRAME_INTERVAL = None  # Seconds between those keyframes, None for every frame (intra-only)
+        self.KEYFRAME_GOP = None  # Maximum frames between two keyframes elsewhere, None for the encoder default
+        self.SLIDE_SEGMENTS = False  # Also write one video per slide with a manifest (see slides.py)
+        self.SLIDES_DIR = None  # Folder of the slides, None for <video name>_slides next to the video
+        self.COALESCE_ANIMATIONS = True  # Play consecutive scheduled animations as one Succession
+        self.HOLD_STATIC_FRAMES = True  # Rasterize the frames of a Wait inside a Succession once (see static_frames.py)
+        self.PROFILE = False  # Time each element by stage into profile.json (see profiler.py)
+        self.PROFILE_TOP = 10  # Slowest elements printed at the end
         
         # State tracking
         self.text_mobjects = VGroup()
+        self.viewport = Viewport(-config.frame_height / 2, config.frame_height / 2)
         self.pause_times = [0]
+        self.checkpoints = [0]  # Video time, in seconds, of each pause
+        self.checkpoint_sources = []  # Element and source line of each checkpoint after the first
+        self.current_segment = ("", "")  # Element and source line being rendered
         self.current_time = 0
-        
-        # Get preamble for LaTeX compilation
-        self.tex_template = self._get_preamble()
+        self.scene_time = 0  # Video time, cached segments included
+        self.scheduled = []  # Animations waiting for the next play call (see schedule())
+        self.timeline = Timeline()
+        self.profiler = Profiler()
+        
+        # Partial movie naming (see segment_cache.py)
+        self.config_fingerprint = None  # Set in construct()
+        self.play_fingerprint = None  # Fingerprint of the segment being rendered
+        self.play_index = 0  # Play calls since the start of the segment
+        self.screen_fingerprint = ""  # Segments whose text is still on screen
+        
+        # Single frame rendering (see render_frame())
+        self.frame_checkpoint = None  # Index in self.checkpoints
+        self.frame_line = None  # Line of the main file
+        self.frame = None  # Pixels of the frame once rendered
+        
+        # Preamble for LaTeX compilation
+        self.tex_template = None  # Set in construct()
     
     def construct(self):
         """Main construction method"""
-        # Parse the document
-        self.elements = self.parser.parse()
+        # Get preamble for LaTeX compilation
+        self.tex_template = self._get_preamble()
+        format_dir = Path(config.get_dir("tex_dir")) / "formats" if self.PRECOMPILED_FORMAT else None
         
-        # Calculate actual text width from LaTeX
-        width_ruler = MathTex(
-            r"\rule{\textwidth}{0.1pt}",
-            tex_template=self.tex_template,
-            font_size=36
+        self.snippet_cache = SnippetCache(
+            self.TEX_CACHE_DIR or os.path.join(config.media_dir, "tex_cache"),
+            self.TEX_CACHE_MAX_MB * 1024 * 1024
         )
+        if self.DRY_RUN:
+            # Manim's skipping mode: animations jump to their end state, no frame is rasterized
+            self.renderer._original_skipping_status = True
+            self.renderer.skip_animations = True
+        if self.KEYFRAMES_AT_CHECKPOINTS:
+            self.request_keyframes()
+        if self.REUSE_SEGMENTS and not self.DRY_RUN:
+            config.max_files_cached = max(config.max_files_cached, self.MAX_CACHED_SEGMENTS)
+            segments = segment_cache.installed()
+        else:
+            segments = contextlib.nullcontext()
+        formats = precompiled_format(format_dir) if format_dir else contextlib.nullcontext()
+        profiler = self.profiler.installed(self) if self.PROFILE else contextlib.nullcontext()
+        with self.snippet_cache.installed(), segments, formats, profiler:
+            try:
+                self.construct_document(format_dir)
+            except FrameReached:
+                self.capture_frame()
+        print(f"LaTeX snippet cache: {self.snippet_cache.hits} hits, {self.snippet_cache.misses} misses, "
+              f"{self.snippet_cache.evictions} evicted")
+        if self.PROFILE:
+            self.profiler.save()
+            print(self.profiler.report(self.PROFILE_TOP))
+    
+    def construct_document(self, format_dir=None):
+        """Render the whole document, or only self.section"""
+        elements = self.parser.iter_elements()
+        last_section = True
+        if self.section is not None:
+            sections = split_sections(list(elements))
+            elements = sections[self.section]
+            last_section = self.section == len(sections) - 1
+        
+        if self.BATCH_TEX:
+            # Every snippet is needed up front
+            elements = list(elements)
+            specs = [self.width_ruler_spec(), self.thanks_spec()]
+            owners = [("batch", self.latex_filename), ("end", "")]  # Element and source of each spec
+            for element in elements:
+                for spec in self.iter_tex_specs(element):
+                    specs.append(spec)
+                    owners.append((element.element_type.value, f"{element.source_file}:{element.line_number}"))
+            times = {} if self.PROFILE else None
+            with self.profile("batch", self.latex_filename):
+                with self.profiler.stage("latex"):
+                    compiled = compile_batch(specs, self.snippet_cache, self.TEX_WORKERS, format_dir, times)
+                # Charge each snippet to the element whose spec produced it
+                charged = {}
+                for index, seconds in (times or {}).items():
+                    if owners[index][0] != "batch":
+                        charged[owners[index]] = charged.get(owners[index], 0.0) + seconds
+                self.profiler.transfer("latex", charged)
+            print(f"Batch LaTeX: {compiled} snippets compiled for {len(specs)} mobjects")
+        elif self.TEX_LOOKAHEAD:
+            elements = compile_ahead(elements, self.iter_tex_specs, self.snippet_cache, self.TEX_LOOKAHEAD, format_dir)
+        
+        self.setup_text_frame()
+        self.config_fingerprint = config_key(self)
+        
+        # Without batching, each element is rendered as soon as the parser completes it and
+        # its snippets are compiled, while those of the next TEX_LOOKAHEAD elements compile
+        for element in elements:
+            self.render_segment(element.element_type.value, f"{element.source_file}:{element.line_number}",
+                                content_key(element), self.render_element, element)
+            if (self.frame_line is not None and element.line_number >= self.frame_line
+                    and os.path.abspath(element.source_file or "") == os.path.abspath(self.latex_filename)):
+                raise FrameReached()
+        
+        if not last_section:
+            # Fade out as the next section starts, so that the videos join seamlessly
+            self.clear_text()
+            return
+        
+        # End of document
+        self.render_segment("end", "", "end_document", self.end_document)
+        if self.section is None and not self.DRY_RUN:
+            self.save_times()
+        print(f"Video length: {self.timeline.total:.1f}s")
+        self.timeline.check_budget(self.TIME_BUDGET)
+    
+    def render(self, preview=False):
+        super().render(preview)
+        if isinstance(self.renderer, HoldingRenderer) and self.renderer.held_frames:
+            print(f"Static frames: {self.renderer.held_frames} held frames not rasterized")
+        if self.DRY_RUN:
+            return
+        if self.SLIDE_SEGMENTS:
+            self.split_slides()
+    
+    def render_frame(self, checkpoint=None, line=None):
+        """Pixels of the frame at a checkpoint (index in self.checkpoints,
+        0 for the empty screen), or once the first element of the main file
+        ending at or after line is rendered. Animations are skipped up to
+        there and only that frame is rasterized."""
+        self.frame_checkpoint, self.frame_line = checkpoint, line
+        self.DRY_RUN = True
+        if checkpoint == 0:
+            self.capture_frame()
+            return self.frame
+        self.render()
+        if self.frame is None:
+            raise Exception(f"No checkpoint {checkpoint} or line {line} in {self.latex_filename}")
+        return self.frame
+    
+    def capture_frame(self):
+        """Rasterize the current state of the scene into self.frame"""
+        self.flush()
+        self.renderer.static_image = None
+        self.renderer.update_frame(self, ignore_skipping=True)
+        self.frame = self.renderer.get_frame()
+    
+    def setup_text_frame(self):
+        """Calculate actual text width from LaTeX"""
+        width_ruler = self.width_ruler_spec().build()
         self.FRAME_TEXT_WIDTH = width_ruler.width
         self.FRAME_TEXT_ORIGIN = [-self.FRAME_TEXT_WIDTH/2, self.FRAME_TEXT_HEIGHT/2, 0]
         
         print(f"Text frame width: {self.FRAME_TEXT_WIDTH}")
-        
-        # Render each element
-        for element in self.elements:
-            self.render_element(element)
-        
-        # End of document
-        self.end_document()
-        self.save_times()
+    
+    def render_segment(self, name, source, content, render, *args):
+        """Call render(*args), its play calls named after a fingerprint of
+        content, of the layout and of the text still on screen. The segment
+        is added to the timeline as name, from source."""
+        start = self.scene_time
+        self.current_segment = (name, source)
+        segment = fingerprint(self.config_fingerprint, content, layout_key(self), self.screen_fingerprint)
+        self.play_fingerprint, self.play_index = segment, 0
+        try:
+            with self.profile(name, source):
+                render(*args)
+                self.flush()
+        finally:
+            self.play_fingerprint = None
+        self.screen_fingerprint = fingerprint(self.screen_fingerprint, segment) if self.text_mobjects else ""
+        self.timeline.add(name, source, start, self.scene_time)
+    
+    def profile(self, name, source):
+        """Attribute what runs inside to the element name at source, when PROFILE is set"""
+        return self.profiler.element(name, source) if self.PROFILE else contextlib.nullcontext()
+    
+    def play(self, *args, **kwargs):
+        self.flush()
+        super().play(*args, **kwargs)
+        self.scene_time += self.played_time()
+    
+    def played_time(self):
+        """Video time written by the last play call: manim writes whole frames,
+        int(duration * fps) for a static Wait and one per frame start in
+        [0, duration) otherwise"""
+        frame_rate = config.frame_rate
+        if self.is_current_animation_frozen_frame():
+            frames = int(self.duration / (1 / frame_rate))
+        else:
+            frames = len(np.arange(0, self.duration, 1 / frame_rate))
+        return frames / frame_rate
+    
+    def schedule(self, *animations):
+        """Play animations one after the other. Consecutive scheduled
+        introducers (Write, FadeIn, Create) and holds (Wait) are queued and
+        played as a single Succession, so that they make one partial movie
+        file, when anything else is played or at flush() (before a scroll or
+        a checkpoint). Any other animation is played on its own: in a
+        Succession, a FadeOut or a transform would show its mobjects from the
+        first frame."""
+        for animation in animations:
+            if self.COALESCE_ANIMATIONS and (animation.is_introducer() or isinstance(animation, Wait)):
+                self.scheduled.append(animation)
+            else:
+                self.play(animation)
+    
+    def flush(self):
+        """Play the scheduled animations"""
+        if not self.scheduled:
+            return
+        animations, self.scheduled = self.scheduled, []
+        if len(animations) == 1:
+            self.play(animations[0])
+            return
+        succession = Succession(*animations)
+        self.play(succession)
+        # Its group only holds the empty mobjects of the Waits: the introduced ones were added on their own
+        self.remove(succession.mobject)
     
     def render_element(self, element):
         """Dispatch to appropriate renderer based on element type"""
@@ -80,14 +338,7 @@ class TexToManimScene(Scene):
     
     def render_text(self, element: TextElement):
         """Render plain text"""
-        text = MathTex(
-            element.content,
-            tex_environment="flushleft",
-            tex_template=self.tex_template,
-            font_size=36,
-            color=self.TEXT_COLOR,
-            substrings_to_isolate= element.content.split("\\pause")
-        )
+        text = self.text_spec(element.content).build()
         #text.set_stroke(color=self.TEXT_COLOR, width=0.05)
 
         self.check_and_scroll()
@@ -102,8 +353,7 @@ class TexToManimScene(Scene):
                 # the choice for the beginning of the index is not stable, compare with align
                 # Probably this is due to the extra term on the left for align, that here is not there.
 
-            self.play(Write(text_part),run_time = len(substring)/20)
-            self.play(Wait(0.8))
+            self.schedule(Write(text_part, run_time=len(substring)/20), Wait(0.8))
             self.text_mobjects.add(text_part)
             
 
@@ -111,13 +361,7 @@ class TexToManimScene(Scene):
     
     def render_equation(self, element: EquationElement):
         """Render equation environment"""
-        eq = MathTex(
-            r"{" + element.content + r"}",
-            tex_environment="equation*",
-            tex_template=self.tex_template,
-            font_size=36,
-            color=self.TEXT_COLOR
-        )
+        eq = self.equation_spec(element.content).build()
         eq.set_stroke(color=self.TEXT_COLOR, width=0.05)
         
         self.check_and_scroll()
@@ -125,8 +369,7 @@ class TexToManimScene(Scene):
         # Center the equation
         eq.next_to(self.get_last_position(), DOWN).align_to(self.FRAME_TEXT_ORIGIN, LEFT)
         eq.shift(RIGHT * (self.FRAME_TEXT_WIDTH - eq.width) / 2)
-        self.play(Write(eq))
-        self.play(Wait(1))
+        self.schedule(Write(eq), Wait(1))
         self.text_mobjects.add(eq)
 
         self.current_time = self.update_time(1)
@@ -134,30 +377,14 @@ class TexToManimScene(Scene):
     def render_align(self, element: AlignElement):
         """Render align environment"""
         # Create the full align as a single MathTex
-        # Extract each column as a substring to isolate
-        substrings_to_isolate = []
-        substrings_to_isolate2 = []
-        for row in element.rows:
-            # TODO split col according to {{}}, keep the count of subsubstring in such col
-            for col in row:
-                if col.strip():
-                     substrings_to_isolate2.extend(re.split("{{(.*?)}}", col) )
-            substrings_to_isolate.extend([col for col in row if col.strip()])
-        #print(f"substrings_to_isolate2 = {substrings_to_isolate2}")
+        substrings_to_isolate, substrings_to_isolate2 = self.align_substrings(element)
         
         # PROBLEM: MathTex is naturally splitting the strings further, so a line can be split more than
         # what is wanted because there is a pattern in another line. This cause the fail of
         # get_part_by_tex and eq_parts become None. Error is given. Need to solve this issure, consider
         # defining a variant XMathTex avoiding to split further...(?)
         # Otherwise, manually insert spaces or empty characters to make the strings distinguishable
-        eq = MathTex(
-            element.full_content,
-            tex_environment="align*",
-            tex_template=self.tex_template,
-            font_size=36,
-            color=self.TEXT_COLOR,
-            substrings_to_isolate=substrings_to_isolate2
-        )
+        eq = self.align_spec(element).build()
 
         print(f"tex_strings = {eq.tex_strings}")
 
@@ -183,9 +410,8 @@ class TexToManimScene(Scene):
                     eq[index_part:].shift(0.5 * self.FRAME_TEXT_HEIGHT * UP)
 
                 # TODO: apply the correct function of rendering according to align_animations
-                self.play(Write(eq_part))
+                self.schedule(Write(eq_part), Wait(1.2))
                 self.text_mobjects.add(eq_part)
-                self.play(Wait(1.2))
             except ValueError:
                 # Substring not found, skip
                 print(f"Warning: Could not find substring in align: {substring[:30]}...")
@@ -200,19 +426,9 @@ class TexToManimScene(Scene):
         thm_animations = []
         
         # Theorem header
+        header = self.theorem_header_spec(element, color, name).build()
         if element.label:
-            header = Tex(
-                rf"\textbf{{{name}}} ({element.label})",
-                font_size=40,
-                color=color
-            )
             print(header)
-        else:
-            header = Tex(
-                rf"\textbf{{{name}}}",
-                font_size=40,
-                color=color
-            )
         
         header.next_to(self.get_last_position(), DOWN).align_on_border([-1, 0, 0], buff=1)
         thm_group.add(header)
@@ -220,15 +436,8 @@ class TexToManimScene(Scene):
         
         # Render theorem content
         for sub_element in element.content:
-            if isinstance(sub_element, TextElement):
-                text = Tex(
-                    sub_element.content,
-                    tex_environment="flushleft",
-                    tex_template=self.tex_template,
-                    font_size=36,
-                    color=self.TEXT_COLOR,
-                    substrings_to_isolate= sub_element.content.split("\\pause")
-                )
+            if sub_element.element_type == ElementType.TEXT:
+                text = self.text_spec(sub_element.content, Tex).build()
                 text.next_to(thm_group[-1], DOWN).align_to(thm_group[0], LEFT)
                 thm_group.add(text)
 
@@ -240,14 +449,8 @@ class TexToManimScene(Scene):
                     thm_animations.append(Wait(0.8))
                 
             
-            elif isinstance(sub_element, EquationElement):
-                eq = MathTex(
-                    r"{" + sub_element.content + r"}",
-                    tex_environment="equation*",
-                    tex_template=self.tex_template,
-                    font_size=36,
-                    color=self.TEXT_COLOR
-                )
+            elif sub_element.element_type == ElementType.EQUATION:
+                eq = self.equation_spec(sub_element.content).build()
                 eq.set_stroke(color=self.TEXT_COLOR, width=0.05)
                 eq.next_to(thm_group[-1], DOWN)
                 eq.shift(RIGHT * (self.FRAME_TEXT_WIDTH - eq.width) / 2)
@@ -255,15 +458,9 @@ class TexToManimScene(Scene):
                 thm_animations.append(Write(eq))
                 thm_animations.append(Wait(0.8))
             
-            elif isinstance(sub_element, AlignElement):
+            elif sub_element.element_type == ElementType.ALIGN:
                 # For align inside theorem, render simpler
-                eq = MathTex(
-                    sub_element.full_content,
-                    tex_environment="align*",
-                    tex_template=self.tex_template,
-                    font_size=36,
-                    color=self.TEXT_COLOR
-                )
+                eq = self.simple_align_spec(sub_element).build()
                 eq.next_to(thm_group[-1], DOWN).align_to(thm_group[-1], LEFT)
                 eq.shift(RIGHT * (self.FRAME_TEXT_WIDTH - eq.width) / 2)
                 thm_group.add(eq)
@@ -278,40 +475,30 @@ class TexToManimScene(Scene):
         thm_animations.append(Create(box))
         
         # Clear screen and play
-        if self.text_mobjects:
-            self.play(FadeOut(*self.text_mobjects))
-            self.text_mobjects.set_submobjects([])
+        self.clear_text()
         
-        for anim in thm_animations:
-            self.play(anim)
-        
-        self.wait(1)
-        self.play(FadeOut(thm_group, box))
+        self.schedule(*thm_animations, Wait(1))
+        self.play(FadeOut(thm_group, box))  # Its own segment, see schedule()
         self.current_time = self.update_time(len(thm_animations))
     
     def render_theorem(self, element: TheoremLikeElement):
         """Render theorem"""
-        self.render_theorem_like(element, ORANGE, "Theorem")
+        self.render_theorem_like(element, *self.THEOREM_STYLES[ElementType.THEOREM])
     
     def render_lemma(self, element: TheoremLikeElement):
         """Render lemma"""
-        self.render_theorem_like(element, GREEN, "Lemma")
+        self.render_theorem_like(element, *self.THEOREM_STYLES[ElementType.LEMMA])
     
     def render_proposition(self, element: TheoremLikeElement):
         """Render proposition"""
-        self.render_theorem_like(element, BLUE, "Proposition")
+        self.render_theorem_like(element, *self.THEOREM_STYLES[ElementType.PROPOSITION])
     
     def render_proof(self, element: ProofElement):
         """Render proof"""
-        prf = Tex(
-            r"\textit{Proof.}",
-            tex_template=self.tex_template,
-            font_size=36,
-            color=ORANGE
-        )
+        prf = self.proof_spec().build()
         prf.next_to(self.get_last_position(), DOWN)
         
-        self.play(Write(prf))
+        self.schedule(Write(prf))
         self.text_mobjects.add(prf)
         
         # Render proof content
@@ -322,23 +509,115 @@ class TexToManimScene(Scene):
     
     def render_section(self, element: SectionElement):
         """Render section header"""
-        if self.text_mobjects:
-            self.play(FadeOut(*self.text_mobjects))
-            self.text_mobjects.set_submobjects([])
+        self.clear_text()
         
-        section_title = Tex(
-            element.title,
-            color=RED,
-            font_size=50
-        )
+        section_title = self.section_spec(element).build()
         
-        self.play(FadeIn(section_title))
-        self.wait(1)
+        self.schedule(FadeIn(section_title), Wait(1))
         self.play(FadeOut(section_title))
         self.current_time = self.update_time(2)
     
+    # ============== LaTeX Specs ==============
+    
+    def iter_tex_specs(self, element):
+        """Specs of every Tex and MathTex rendering an element builds"""
+        if element.element_type == ElementType.TEXT:
+            yield self.text_spec(element.content)
+        elif element.element_type == ElementType.EQUATION:
+            yield self.equation_spec(element.content)
+        elif element.element_type == ElementType.ALIGN:
+            yield self.align_spec(element)
+        elif element.element_type in self.THEOREM_STYLES:
+            yield self.theorem_header_spec(element, *self.THEOREM_STYLES[element.element_type])
+            for sub_element in element.content:
+                if sub_element.element_type == ElementType.TEXT:
+                    yield self.text_spec(sub_element.content, Tex)
+                elif sub_element.element_type == ElementType.EQUATION:
+                    yield self.equation_spec(sub_element.content)
+                elif sub_element.element_type == ElementType.ALIGN:
+                    yield self.simple_align_spec(sub_element)
+        elif element.element_type == ElementType.PROOF:
+            yield self.proof_spec()
+            for sub_element in element.content:
+                yield from self.iter_tex_specs(sub_element)
+        elif element.element_type == ElementType.SECTION:
+            yield self.section_spec(element)
+    
+    def width_ruler_spec(self):
+        return TexSpec(MathTex, (r"\rule{\textwidth}{0.1pt}",), dict(
+            tex_template=self.tex_template,
+            font_size=36
+        ))
+    
+    def text_spec(self, content, mobject_class=MathTex):
+        return TexSpec(mobject_class, (content,), dict(
+            tex_environment="flushleft",
+            tex_template=self.tex_template,
+            font_size=36,
+            color=self.TEXT_COLOR,
+            substrings_to_isolate=content.split("\\pause")
+        ))
+    
+    def equation_spec(self, content):
+        return TexSpec(MathTex, (r"{" + content + r"}",), dict(
+            tex_environment="equation*",
+            tex_template=self.tex_template,
+            font_size=36,
+            color=self.TEXT_COLOR
+        ))
+    
+    def align_spec(self, element):
+        return TexSpec(MathTex, (element.full_content,), dict(
+            tex_environment="align*",
+            tex_template=self.tex_template,
+            font_size=36,
+            color=self.TEXT_COLOR,
+            substrings_to_isolate=self.align_substrings(element)[1]
+        ))
+    
+    def simple_align_spec(self, element):
+        return TexSpec(MathTex, (element.full_content,), dict(
+            tex_environment="align*",
+            tex_template=self.tex_template,
+            font_size=36,
+            color=self.TEXT_COLOR
+        ))
+    
+    def theorem_header_spec(self, element, color, name):
+        if element.label:
+            header = rf"\textbf{{{name}}} ({element.label})"
+        else:
+            header = rf"\textbf{{{name}}}"
+        return TexSpec(Tex, (header,), dict(font_size=40, color=color))
+    
+    def proof_spec(self):
+        return TexSpec(Tex, (r"\textit{Proof.}",), dict(
+            tex_template=self.tex_template,
+            font_size=36,
+            color=ORANGE
+        ))
+    
+    def section_spec(self, element):
+        return TexSpec(Tex, (element.title,), dict(color=RED, font_size=50))
+    
+    def thanks_spec(self):
+        return TexSpec(Tex, (r"Thanks for watching!",), dict(font_size=100, color=self.TEXT_COLOR))
+    
     # ============== Helper Methods ==============
     
+    def align_substrings(self, element):
+        """Non-empty columns of an align, and the same columns split at {{ }}"""
+        # Extract each column as a substring to isolate
+        substrings_to_isolate = []
+        substrings_to_isolate2 = []
+        for row in element.rows:
+            # TODO split col according to {{}}, keep the count of subsubstring in such col
+            for col in row:
+                if col.strip():
+                     substrings_to_isolate2.extend(re.split("{{(.*?)}}", col) )
+            substrings_to_isolate.extend([col for col in row if col.strip()])
+        return substrings_to_isolate, substrings_to_isolate2
+    
     def get_last_position(self):
         """Get position for next element"""
         if self.text_mobjects:
@@ -352,54 +631,107 @@ class TexToManimScene(Scene):
             self.scroll(0.5 * self.FRAME_TEXT_HEIGHT)
     
     def scroll(self, length):
-        """Scroll all text upward"""
-        self.play(self.text_mobjects.animate.shift(length * UP))
+        """Scroll all text upward, animating only what the camera sees
+        before or after the shift"""
+        self.flush()  # Before moving the text of the scheduled animations
+        mobjects = list(self.text_mobjects)
+        extents = self.viewport.measure(mobjects)
+        moving = self.viewport.visible(extents) | self.viewport.visible(extents, length)
+        animated, hidden = self.viewport.split(mobjects, moving)
+        for mobj in hidden:
+            mobj.shift(length * UP)
+        if animated:
+            self.play(VGroup(*animated).animate.shift(length * UP))
+        else:
+            self.wait(1)
         
         # Remove objects that scrolled off screen
-        for mobj in list(self.text_mobjects):
-            if mobj.get_bottom()[1] > self.FRAME_TEXT_ORIGIN[1]:
-                self.remove(mobj)
-                self.text_mobjects.remove(mobj)
+        gone, kept = self.viewport.split(mobjects, extents[:, 0] + length > self.FRAME_TEXT_ORIGIN[1])
+        if gone:
+            self.remove(*gone)
+            self.text_mobjects.set_submobjects(kept)
+    
+    def clear_text(self):
+        """Fade out the text on screen and stop tracking it"""
+        self.flush()
+        if not self.text_mobjects:
+            return
+        mobjects = list(self.text_mobjects)
+        on_screen, hidden = self.viewport.split(mobjects, self.viewport.visible(self.viewport.measure(mobjects)))
+        self.remove(*hidden)
+        if on_screen:
+            self.play(FadeOut(*on_screen))
+        else:
+            self.wait(1)
+        self.text_mobjects.set_submobjects([])
     
     def update_time(self, increment):
         """Update timing information"""
+        self.flush()  # The checkpoint is after the scheduled animations
         new_time = self.current_time + increment
         self.pause_times.append(new_time)
+        self.checkpoints.append(self.scene_time)
+        self.checkpoint_sources.append(self.current_segment)
+        for file_writer in self.keyframe_writers():
+            file_writer.mark_checkpoint()
+        if self.frame_checkpoint is not None and len(self.checkpoints) - 1 >= self.frame_checkpoint:
+            raise FrameReached()
         return new_time
     
     def end_document(self):
         """Render end of document"""
-        if self.text_mobjects:
-            self.play(FadeOut(*self.text_mobjects))
-            self.text_mobjects.set_submobjects([])
+        self.clear_text()
         
-        thanks = Tex(
-            r"Thanks for watching!",
-            font_size=100,
-            color=self.TEXT_COLOR
-        )
+        thanks = self.thanks_spec().build()
         thanks.set_stroke(color=self.TEXT_COLOR, width=0.1)
         
-        self.play(Write(thanks))
-        self.wait(2)
+        self.schedule(Write(thanks), Wait(2))
+    
+    def keyframe_writers(self):
+        """File writers of the video and of the extra outputs that take encoder options"""
+        file_writers = [self.renderer.file_writer]
+        if isinstance(self.renderer, MultiTargetRenderer):
+            file_writers += [target.file_writer for target in self.renderer.targets]
+        return [file_writer for file_writer in file_writers if isinstance(file_writer, KeyframeFileWriter)]
+    
+    def request_keyframes(self):
+        """Have the partial movies encoded with the keyframes of the KEYFRAME_
+        settings, in every output"""
+        check_encoder_pipe()
+        for file_writer in self.keyframe_writers():
+            file_writer.options = ["-g", str(self.KEYFRAME_GOP)] if self.KEYFRAME_GOP else []
+            file_writer.checkpoint_options = keyframe_options(self.KEYFRAME_WINDOW, self.KEYFRAME_INTERVAL)
+    
+    def split_slides(self):
+        """Write each pause-to-pause part of the video as its own file"""
+        movie = self.renderer.file_writer.movie_file_path
+        if not config.write_to_movie or movie is None or not Path(movie).exists():
+            return
+        output_dir = self.SLIDES_DIR or Path(movie).with_name(f"{Path(movie).stem}_slides")
+        # Stream copy: with manim's ffmpeg pipe, each checkpoint starts a partial movie, hence a keyframe
+        slides = split_slides(str(movie), self.checkpoints, self.checkpoint_sources, self.scene_time,
+                              str(output_dir), copy=ENCODER_PIPE)
+        print(f"{len(slides)} slides written to {output_dir}")
     
     def save_times(self):
-        """Save pause times to file"""
+        """Save pause times, checkpoints and the timeline to file"""
         with open("times.pkl", 'wb') as f:
             pickle.dump(self.pause_times, f)
+        with open("checkpoints.pkl", 'wb') as f:
+            pickle.dump(self.checkpoints, f)
+        self.timeline.save()
     
     def _get_preamble(self):
         """Extract preamble from LaTeX file"""
         template = TexTemplate()
         
+        # The parser reuses the same read of the file for the body
         try:
-            with open(self.latex_filename, 'r', encoding='utf-8') as f:
-                for line in f:
-                    if line.startswith('\\documentclass'):
-                        continue
-                    if line.startswith('\\begin{document}'):
-                        break
-                    template.add_to_preamble(line)
+            preamble = self.parser.load_document().preamble
+            if self.PRUNE_PREAMBLE:
+                preamble = prune_preamble(preamble, self.PREAMBLE_DENY, self.PREAMBLE_ALLOW)
+            for line in preamble:
+                template.add_to_preamble(line)
         except Exception as e:
             print(f"Warning: Could not read preamble: {e}")
         
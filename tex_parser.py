@@ -4,8 +4,12 @@ Parses LaTeX documents into structured elements for animation
 """
 
 from dataclasses import dataclass, field
-from typing import List, Optional, Dict
+from typing import FrozenSet, Iterable, Iterator, List, Optional, Dict, Set, Tuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from enum import Enum
+import hashlib
+import io
+import os
 import re
 
 
@@ -18,6 +22,7 @@ class ElementType(Enum):
     PROPOSITION = "proposition"
     PROOF = "proof"
     SECTION = "section"
+    INCLUDE = "include"
 
 
 @dataclass
@@ -26,6 +31,10 @@ class TexElement:
     element_type: ElementType
     line_number: int
     
+    # File the element comes from, set by the parser. Not a dataclass field,
+    # so that subclasses keep their positional fields.
+    source_file = None
+    
     
 @dataclass
 class TextElement(TexElement):
@@ -83,6 +92,16 @@ class SectionElement(TexElement):
         self.element_type = ElementType.SECTION
 
 
+@dataclass
+class IncludeElement(TexElement):
+    """\\input or \\include line, replaced by the elements of the included
+    file unless the parser leaves includes unresolved"""
+    filename: str
+    
+    def __post_init__(self):
+        self.element_type = ElementType.INCLUDE
+
+
 class ParserState(Enum):
     NORMAL = "normal"
     IN_EQUATION = "in_equation"
@@ -93,11 +112,151 @@ class ParserState(Enum):
     IN_PROOF = "in_proof"
 
 
+THEOREM_LIKE_STATES = (ParserState.IN_THEOREM, ParserState.IN_LEMMA,
+                       ParserState.IN_PROPOSITION, ParserState.IN_PROOF)
+
+THEOREM_TYPE_MAP = {
+    ParserState.IN_THEOREM: ElementType.THEOREM,
+    ParserState.IN_LEMMA: ElementType.LEMMA,
+    ParserState.IN_PROPOSITION: ElementType.PROPOSITION,
+}
+
+# Key in TexParser.patterns (and token kind) closing each theorem-like state
+END_PATTERN_KEYS = {
+    ParserState.IN_THEOREM: 'end_thm',
+    ParserState.IN_LEMMA: 'end_lem',
+    ParserState.IN_PROPOSITION: 'end_prop',
+    ParserState.IN_PROOF: 'end_proof',
+}
+
+# Single alternation used by the tokenizer engine. Every anchor starts with a
+# backslash and contains no other one, so matches never hide each other.
+TOKEN_PATTERN = re.compile(
+    r'\\(?:section\{'
+    r'|(?:begin|end)\{(?:thm|lem|prop|proof|equation\*?|align\*?|document)\}'
+    r'|input\{|include\{'
+    r'|\[|\])'
+)
+
+# Token kind for each anchor matched by TOKEN_PATTERN
+TOKEN_KINDS = {
+    '\\section{': 'section',
+    '\\begin{thm}': 'begin_thm',
+    '\\begin{lem}': 'begin_lem',
+    '\\begin{prop}': 'begin_prop',
+    '\\begin{proof}': 'begin_proof',
+    '\\begin{equation}': 'begin_equation',
+    '\\begin{equation*}': 'begin_equation',
+    '\\[': 'begin_equation',
+    '\\begin{align}': 'begin_align',
+    '\\begin{align*}': 'begin_align',
+    '\\begin{document}': None,
+    '\\end{thm}': 'end_thm',
+    '\\end{lem}': 'end_lem',
+    '\\end{prop}': 'end_prop',
+    '\\end{proof}': 'end_proof',
+    '\\end{equation}': 'end_equation',
+    '\\end{equation*}': 'end_equation',
+    '\\]': 'end_equation',
+    '\\end{align}': 'end_align',
+    '\\end{align*}': 'end_align',
+    '\\end{document}': 'end_document',
+    '\\input{': 'include',
+    '\\include{': 'include',
+}
+
+NO_TOKENS: FrozenSet[str] = frozenset()
+
+
+def tokenize(line: str) -> Set[str]:
+    """Scan a line once and return the kinds of the tokens it contains"""
+    # Fast path: every token starts with a backslash
+    if '\\' not in line:
+        return NO_TOKENS
+    return {TOKEN_KINDS[token] for token in TOKEN_PATTERN.findall(line)}
+
+
+@dataclass
+class DocumentModel:
+    """A LaTeX file read once and split at \\begin{document}
+    
+    The preamble (without \\documentclass) builds the TexTemplate and its
+    hash keys whatever depends on it; the parser starts at the body. Files
+    without \\begin{document}, such as included chapters, are all body.
+    """
+    filename: str
+    data: bytes = field(repr=False)  # Raw content of the file (or a memory map of it)
+    preamble: List[str]
+    preamble_hash: str
+    body_offset: int  # Byte offset of the \begin{document} line
+    body_line: int  # Line number of the \begin{document} line
+    
+    @classmethod
+    def load(cls, filename: str) -> 'DocumentModel':
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"LaTeX file not found: {filename}")
+        return cls.from_buffer(filename, data)
+    
+    @classmethod
+    def from_buffer(cls, filename: str, data: bytes) -> 'DocumentModel':
+        """Split raw content, decoding the preamble only"""
+        preamble = []
+        offset, line_number = 0, 1
+        while offset < len(data):
+            newline = data.find(b'\n', offset)
+            end = len(data) if newline < 0 else newline + 1
+            if data[offset:offset + 16] == b'\\begin{document}':
+                break
+            preamble.append(data[offset:end])
+            offset, line_number = end, line_number + 1
+        else:
+            # No \begin{document}: everything is body
+            preamble, offset, line_number = [], 0, 1
+        
+        preamble = list(io.StringIO(b''.join(preamble).decode('utf-8'), newline=None))
+        preamble = [line for line in preamble if not line.startswith('\\documentclass')]
+        return cls(
+            filename=filename,
+            data=data,
+            preamble=preamble,
+            preamble_hash=hashlib.sha1(''.join(preamble).encode('utf-8')).hexdigest(),
+            body_offset=offset,
+            body_line=line_number,
+        )
+    
+    def iter_body_lines(self) -> Iterator[str]:
+        """Lines of the body, with newlines translated as in text mode"""
+        return iter(io.StringIO(self.data[self.body_offset:].decode('utf-8'), newline=None))
+
+
 class TexParser:
-    """Parses LaTeX documents into structured elements"""
+    """Parses LaTeX documents into structured elements
+    
+    Two engines produce the same elements:
+    - 'tokenizer' (default) scans each line once with TOKEN_PATTERN
+    - 'regex' runs the patterns of self.patterns one after another
+    """
     
-    def __init__(self, filename: str):
+    ENGINES = ('tokenizer', 'regex')
+    
+    def __init__(self, filename: str, quiet: bool = False, engine: str = 'tokenizer',
+                 cache: Optional['ElementCache'] = None, resolve_includes: bool = True,
+                 root_dir: Optional[str] = None, include_chain: Tuple[str, ...] = ()):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown parser engine: {engine}")
         self.filename = filename
+        self.quiet = quiet  # No per-line logging when True
+        self.engine = engine
+        self.cache = cache  # element_cache.ElementCache, reparses changed blocks only
+        
+        # \input and \include paths are relative to the main document
+        self.resolve_includes = resolve_includes
+        self.root_dir = root_dir if root_dir is not None else os.path.dirname(filename)
+        self.include_chain = include_chain + (os.path.abspath(filename),)
+        self.document: Optional[DocumentModel] = None  # Set by load_document()
         self.elements: List[TexElement] = []
         self.state = ParserState.NORMAL
         self.state_stack: List[ParserState] = []
@@ -127,27 +286,153 @@ class TexParser:
             'end_proof': re.compile(r'\\end\{proof\}'),
             'end_document': re.compile(r'\\end\{document\}'),
             'manim_directive': re.compile(r'%\s*Manim:\s*(\w+)'),
+            'include': re.compile(r'\\(?:input|include)\{([^}]+)\}'),
         }
     
     def parse(self) -> List[TexElement]:
         """Parse the entire LaTeX file and return structured elements"""
+        self.elements = list(self.iter_elements())
+        return self.elements
+    
+    def iter_elements(self) -> Iterator[TexElement]:
+        """Parse the body of the LaTeX file lazily, yielding each top-level
+        element as soon as its environment is closed"""
+        document = self.load_document()
+        yield from self.iter_lines(document.iter_body_lines(), document.body_line)
+    
+    def load_document(self) -> DocumentModel:
+        """Read the file, once, into a DocumentModel"""
+        if self.document is None:
+            self.document = DocumentModel.load(self.filename)
+        return self.document
+    
+    def iter_lines(self, lines: Iterable[str], first_line: int = 1) -> Iterator[TexElement]:
+        """Parse source lines numbered from first_line, through the element
+        cache when there is one"""
+        if self.cache is not None:
+            elements = self.cache.iter_elements(self, lines, first_line)
+        else:
+            elements = self._iter_parsed(lines, first_line)
+        
+        for element in elements:
+            set_source_file(element, self.filename)
+            if self.resolve_includes and element.element_type == ElementType.INCLUDE:
+                yield from self.include(element).iter_elements()
+            else:
+                yield element
+    
+    def include(self, element: IncludeElement) -> 'TexParser':
+        """Parser for the file included by an \\input or \\include line"""
+        path = resolve_include(self.root_dir, element.filename)
+        if os.path.abspath(path) in self.include_chain:
+            raise Exception(f"Circular include of {path} at line {element.line_number} of {self.filename}")
+        return type(self)(path, quiet=self.quiet, engine=self.engine, cache=self.cache,
+                          root_dir=self.root_dir, include_chain=self.include_chain)
+    
+    def iter_blocks(self, lines: Iterable[str], first_line: int = 1) -> Iterator[Tuple[int, List[str], bool]]:
+        """Split source lines into top-level blocks, yielding (first line
+        number, lines, closed) for each
+        
+        A block is either a single line parsed in normal state or a whole
+        environment, from its begin to the line closing it, preceded by the
+        blank and comment lines before it. The parser is in normal state with
+        an empty stack at the end of every closed block, so each block parses
+        the same way on its own. Only the last block can be unterminated.
+        """
+        stack: List[ParserState] = []
+        block: List[str] = []
+        start = first_line
+        for line_number, line in enumerate(lines, first_line):
+            tokens = tokenize(line)
+            if 'end_document' in tokens:
+                break
+            if not block:
+                start = line_number
+            block.append(line)
+            if line.startswith('%') or not line.strip():
+                continue
+            
+            if not stack:
+                state = self._opening_state(line, tokens)
+                if state is not None:
+                    stack.append(state)
+                    continue
+            else:
+                state = stack[-1]
+                if state == ParserState.IN_EQUATION:
+                    if 'end_equation' in tokens:
+                        stack.pop()
+                elif state == ParserState.IN_ALIGN:
+                    if 'end_align' in tokens:
+                        stack.pop()
+                elif END_PATTERN_KEYS[state] in tokens:
+                    stack.pop()
+                elif nested := self._opening_state(line, tokens):
+                    stack.append(nested)
+            
+            if not stack:
+                yield start, block, True
+                block = []
+        
+        if block:
+            yield start, block, not stack
+    
+    def spawn(self) -> 'TexParser':
+        """New parser for a single block of the same file: same settings,
+        no cache and includes left unresolved"""
+        return TexParser(self.filename, quiet=self.quiet, engine=self.engine,
+                         resolve_includes=False, root_dir=self.root_dir)
+    
+    def _opening_state(self, line: str, tokens: Set[str]) -> Optional[ParserState]:
+        """State entered by a line parsed in normal state, None if it stays
+        normal (same priorities as _dispatch_normal_line)"""
+        if not tokens:
+            return None
+        if 'section' in tokens and self.patterns['section'].search(line):
+            return None
+        for kind, state in (('begin_thm', ParserState.IN_THEOREM),
+                            ('begin_lem', ParserState.IN_LEMMA),
+                            ('begin_prop', ParserState.IN_PROPOSITION),
+                            ('begin_proof', ParserState.IN_PROOF),
+                            ('begin_equation', ParserState.IN_EQUATION),
+                            ('begin_align', ParserState.IN_ALIGN)):
+            if kind in tokens:
+                return state
+        return None
+    
+    def _iter_parsed(self, lines: Iterable[str], first_line: int) -> Iterator[TexElement]:
+        """Parse source lines, yielding each top-level element once complete"""
         try:
-            with open(self.filename, 'r', encoding='utf-8') as f:
-                for line_num, line in enumerate(f, 1):
+            for line_num, line in enumerate(lines, first_line):
+                if self.engine == 'tokenizer':
+                    tokens = tokenize(line)
+                    if 'end_document' in tokens:
+                        break
+                    self.line_number = line_num
+                    self._parse_tokenized_line(line, tokens)
+                else:
                     # Check for end of document
                     if self.patterns['end_document'].search(line):
                         break
                     self.line_number = line_num
                     self._parse_line(line)
+                if not self.quiet:
                     print(f"Line {self.line_number:4} |" +"---"*len(self.state_stack) + f" now {self.state.value}")
+                
+                # Back in normal state: every pending element is complete
+                if self.state == ParserState.NORMAL and self.elements:
+                    pending, self.elements = self.elements, []
+                    yield from pending
             
-            return self.elements
+            # Flush what is left by unterminated environments
+            pending, self.elements = self.elements, []
+            yield from pending
         
-        except FileNotFoundError:
-            raise FileNotFoundError(f"LaTeX file not found: {self.filename}")
         except Exception as e:
             raise Exception(f"Error parsing line {self.line_number}: {str(e)}")
     
+    # ============== Regex engine ==============
+    
     def _parse_line(self, line: str):
         """Parse a single line based on current state"""
         
@@ -165,8 +450,7 @@ class TexParser:
             self._parse_equation_line(line)
         elif self.state == ParserState.IN_ALIGN:
             self._parse_align_line(line)
-        elif self.state in [ParserState.IN_THEOREM, ParserState.IN_LEMMA, 
-                           ParserState.IN_PROPOSITION, ParserState.IN_PROOF]:
+        elif self.state in THEOREM_LIKE_STATES:
             self._parse_theorem_like_line(line)
     
     def _parse_normal_line(self, line: str):
@@ -174,27 +458,20 @@ class TexParser:
         
         # Section
         if match := self.patterns['section'].search(line):
-            self.elements.append(SectionElement(
-                element_type=ElementType.SECTION,
-                line_number=self.line_number,
-                title=match.group(1)
-            ))
+            self._add_section(match.group(1))
             return
         
         # Begin theorem-like environments
         if match := self.patterns['begin_thm'].search(line):
-            self._enter_state(ParserState.IN_THEOREM)
-            self.current_label = match.group(1) if match.group(1) else None
+            self._begin_theorem_like(ParserState.IN_THEOREM, match.group(1))
             return
         
         if match := self.patterns['begin_lem'].search(line):
-            self._enter_state(ParserState.IN_LEMMA)
-            self.current_label = match.group(1) if match.group(1) else None
+            self._begin_theorem_like(ParserState.IN_LEMMA, match.group(1))
             return
         
         if match := self.patterns['begin_prop'].search(line):
-            self._enter_state(ParserState.IN_PROPOSITION)
-            self.current_label = match.group(1) if match.group(1) else None
+            self._begin_theorem_like(ParserState.IN_PROPOSITION, match.group(1))
             return
         
         if self.patterns['begin_proof'].search(line):
@@ -211,118 +488,215 @@ class TexParser:
             self._enter_state(ParserState.IN_ALIGN)
             return
         
+        # \input and \include, only at the top level
+        if self.state == ParserState.NORMAL and (match := self.patterns['include'].search(line)):
+            self._add_include(match.group(1))
+            return
+        
         # Regular text (not a command, not a comment)
         if not line.startswith('\\') and not line.startswith('%'):
-            self.elements.append(TextElement(
-                element_type=ElementType.TEXT,
-                line_number=self.line_number,
-                content=line.strip()
-            ))
+            self._add_text(line)
     
     def _parse_equation_line(self, line: str):
         """Parse line inside equation environment"""
         if self.patterns['end_equation'].search(line):
-            # Create equation element
-            if self.state_stack[-1] in [ParserState.IN_THEOREM, ParserState.IN_LEMMA, ParserState.IN_PROPOSITION, ParserState.IN_PROOF]:
-                self.current_theorem_content.append(EquationElement(
-                    element_type=ElementType.EQUATION,
-                    line_number=self.line_number,
-                    content=''.join(self.current_content),
-                    environment='equation'
-                ))
-            else:
-                self.elements.append(EquationElement(
-                    element_type=ElementType.EQUATION,
-                    line_number=self.line_number,
-                    content=''.join(self.current_content),
-                    environment='equation'
-                ))
-            self._exit_state()
+            self._close_equation()
         else:
-            self.current_content.append(line)
+            self._add_equation_line(line)
     
     def _parse_align_line(self, line: str):
         """Parse line inside align environment"""
         if self.patterns['end_align'].search(line):
-            print(f"ALIGN ROWS : {self.current_align_rows}")
-            # Create align element dividere case di nested env
-            if self.state_stack[-1] in [ParserState.IN_THEOREM, ParserState.IN_LEMMA, ParserState.IN_PROPOSITION, ParserState.IN_PROOF]:
-                self.current_theorem_content.append(AlignElement(
-                    element_type=ElementType.ALIGN,
-                    line_number=self.line_number,
-                    rows=self.current_align_rows.copy(),
-                    full_content=''.join(self.current_content),
-                    align_animations = self.current_align_animations.copy()
-                ))
-            else:
-                self.elements.append(AlignElement(
-                    element_type=ElementType.ALIGN,
-                    line_number=self.line_number,
-                    rows=self.current_align_rows.copy(),
-                    full_content=''.join(self.current_content),
-                    align_animations = self.current_align_animations.copy()
-                ))
-            self.current_align_animations = []
-            self._exit_state()
+            self._close_align()
         else:
-            self.current_content.append(line.replace("\\pause",""))
-            # Split by & to get columns
-            # WARNING: always write \pause& instead of &\pause !
-            columns = [col for col in line.split('\\pause')]
-            self.current_align_rows.append(columns)
-            if manim_dir:= self.patterns['manim_directive'].search(line):
-                self.current_align_animations.append(manim_dir.group(1).strip() if manim_dir.group(1) else "Write")
-            else: 
-                self.current_align_animations.append("Write")
+            self._add_align_row(line, self.patterns['manim_directive'].search(line))
 
     def _parse_theorem_like_line(self, line: str):
         """Parse line inside theorem/lemma/proposition/proof"""
         
         # Check for end of current environment
-        end_patterns = {
-            ParserState.IN_THEOREM: self.patterns['end_thm'],
-            ParserState.IN_LEMMA: self.patterns['end_lem'],
-            ParserState.IN_PROPOSITION: self.patterns['end_prop'],
-            ParserState.IN_PROOF: self.patterns['end_proof'],
-        }
-        
-        if end_patterns[self.state].search(line):
-            # Create appropriate element
-            if self.state == ParserState.IN_PROOF:
-                self.elements.append(ProofElement(
-                    element_type=ElementType.PROOF,
-                    line_number=self.line_number,
-                    content=self.current_theorem_content.copy()
-                ))
-            else:
-                theorem_type_map = {
-                    ParserState.IN_THEOREM: ElementType.THEOREM,
-                    ParserState.IN_LEMMA: ElementType.LEMMA,
-                    ParserState.IN_PROPOSITION: ElementType.PROPOSITION,
-                }
-                
-                #print(f"Defining TheoremElement : label = {self.current_label}")
-                self.elements.append(TheoremLikeElement(
-                    element_type=theorem_type_map[self.state],
-                    line_number=self.line_number,
-                    theorem_type=theorem_type_map[self.state],
-                    label=self.current_label,
-                    content=self.current_theorem_content.copy()
-                ))
-            
-            self._exit_state()
+        if self.patterns[END_PATTERN_KEYS[self.state]].search(line):
+            self._close_theorem_like()
             return
         
         # Otherwise, recursively parse the content
-        # Save current state
         saved_state = self.state
+        self._parse_normal_line(line)
+        self._collect_theorem_content(saved_state)
+    
+    # ============== Tokenizer engine ==============
+    
+    def _parse_tokenized_line(self, line: str, tokens: Set[str]):
+        """Parse a single line based on current state, using its tokens"""
         
-        #self.state = ParserState.NORMAL
+        # Skip empty lines, pure whitespace and comments
+        if line.startswith("%") or not line.strip():
+            return
         
-        # Parse the line
-        self._parse_normal_line(line)
+        if self.state == ParserState.NORMAL:
+            self._dispatch_normal_line(line, tokens)
+        elif self.state == ParserState.IN_EQUATION:
+            if 'end_equation' in tokens:
+                self._close_equation()
+            else:
+                self._add_equation_line(line)
+        elif self.state == ParserState.IN_ALIGN:
+            if 'end_align' in tokens:
+                self._close_align()
+            else:
+                directive = self.patterns['manim_directive'].search(line) if '%' in line else None
+                self._add_align_row(line, directive)
+        elif self.state in THEOREM_LIKE_STATES:
+            if END_PATTERN_KEYS[self.state] in tokens:
+                self._close_theorem_like()
+                return
+            saved_state = self.state
+            self._dispatch_normal_line(line, tokens)
+            self._collect_theorem_content(saved_state)
+    
+    def _dispatch_normal_line(self, line: str, tokens: Set[str]):
+        """Same decisions as _parse_normal_line, in the same priority order"""
+        if tokens:
+            if 'section' in tokens:
+                if match := self.patterns['section'].search(line):
+                    self._add_section(match.group(1))
+                    return
+            
+            for kind, state in (('begin_thm', ParserState.IN_THEOREM),
+                                ('begin_lem', ParserState.IN_LEMMA),
+                                ('begin_prop', ParserState.IN_PROPOSITION)):
+                if kind in tokens:
+                    match = self.patterns[kind].search(line)
+                    self._begin_theorem_like(state, match.group(1))
+                    return
+            
+            if 'begin_proof' in tokens:
+                self._enter_state(ParserState.IN_PROOF)
+                return
+            
+            if 'begin_equation' in tokens:
+                self._enter_state(ParserState.IN_EQUATION)
+                return
+            
+            if 'begin_align' in tokens:
+                self._enter_state(ParserState.IN_ALIGN)
+                return
+            
+            if 'include' in tokens and self.state == ParserState.NORMAL:
+                if match := self.patterns['include'].search(line):
+                    self._add_include(match.group(1))
+                    return
         
-        # If a new TextElement was added, move it to theorem content
+        if not line.startswith('\\') and not line.startswith('%'):
+            self._add_text(line)
+    
+    # ============== Element construction ==============
+    
+    def _add_section(self, title: str):
+        self.elements.append(SectionElement(
+            element_type=ElementType.SECTION,
+            line_number=self.line_number,
+            title=title
+        ))
+    
+    def _add_text(self, line: str):
+        self.elements.append(TextElement(
+            element_type=ElementType.TEXT,
+            line_number=self.line_number,
+            content=line.strip()
+        ))
+    
+    def _add_include(self, filename: str):
+        self.elements.append(IncludeElement(
+            element_type=ElementType.INCLUDE,
+            line_number=self.line_number,
+            filename=filename.strip()
+        ))
+    
+    def _add_nested(self, element: TexElement):
+        """Add an equation or align to the enclosing theorem-like
+        environment, or to the top level"""
+        if self.state_stack[-1] in THEOREM_LIKE_STATES:
+            self.current_theorem_content.append(element)
+        else:
+            self.elements.append(element)
+    
+    def _begin_theorem_like(self, state: ParserState, label: Optional[str]):
+        self._enter_state(state)
+        self.current_label = label if label else None
+    
+    def _add_equation_line(self, line: str):
+        self.current_content.append(line)
+    
+    def _close_equation(self):
+        self._add_nested(EquationElement(
+            element_type=ElementType.EQUATION,
+            line_number=self.line_number,
+            content=''.join(self.current_content),
+            environment='equation'
+        ))
+        self._exit_state()
+    
+    def _add_align_row(self, line: str, directive: Optional[re.Match]):
+        self.current_content.append(line.replace("\\pause",""))
+        # Split by & to get columns
+        # WARNING: always write \pause& instead of &\pause !
+        columns = [col for col in line.split('\\pause')]
+        self.current_align_rows.append(columns)
+        if directive:
+            self.current_align_animations.append(directive.group(1).strip() if directive.group(1) else "Write")
+        else: 
+            self.current_align_animations.append("Write")
+    
+    def _close_align(self):
+        if not self.quiet:
+            print(f"ALIGN ROWS : {self.current_align_rows}")
+        # Create align element dividere case di nested env
+        # The element takes over the row lists, fresh ones are started
+        self._add_nested(AlignElement(
+            element_type=ElementType.ALIGN,
+            line_number=self.line_number,
+            rows=self.current_align_rows,
+            full_content=''.join(self.current_content),
+            align_animations = self.current_align_animations
+        ))
+        self.current_align_rows = []
+        self.current_align_animations = []
+        self._exit_state()
+    
+    def _close_theorem_like(self):
+        # Create appropriate element
+        content = self._take_theorem_content()
+        if self.state == ParserState.IN_PROOF:
+            self.elements.append(ProofElement(
+                element_type=ElementType.PROOF,
+                line_number=self.line_number,
+                content=content
+            ))
+        else:
+            self.elements.append(TheoremLikeElement(
+                element_type=THEOREM_TYPE_MAP[self.state],
+                line_number=self.line_number,
+                theorem_type=THEOREM_TYPE_MAP[self.state],
+                label=self.current_label,
+                content=content
+            ))
+        
+        self._exit_state()
+    
+    def _take_theorem_content(self) -> List[TexElement]:
+        """Hand the theorem content list over to the closing element. An
+        enclosing theorem-like environment keeps appending to a copy, as it
+        did before to the shared list."""
+        content = self.current_theorem_content
+        if self.state_stack and self.state_stack[-1] in THEOREM_LIKE_STATES:
+            self.current_theorem_content = list(content)
+        else:
+            self.current_theorem_content = []
+        return content
+    
+    def _collect_theorem_content(self, saved_state: ParserState):
+        """Move an element created by the current line into the theorem content"""
         if self.elements and self.elements[-1].line_number == self.line_number:
             self.current_theorem_content.append(self.elements.pop())
             # Restore state
@@ -333,8 +707,7 @@ class TexParser:
         self.state_stack.append(self.state)
         self.state = new_state
         self.current_content = []
-        if new_state in [ParserState.IN_THEOREM, ParserState.IN_LEMMA, 
-                        ParserState.IN_PROPOSITION, ParserState.IN_PROOF]:
+        if new_state in THEOREM_LIKE_STATES:
             self.current_theorem_content = []
         elif new_state == ParserState.IN_ALIGN:
             self.current_align_rows = []
@@ -350,6 +723,87 @@ class TexParser:
         
 
 
+def set_source_file(element: TexElement, filename: str):
+    """Record the source file of an element and of its content"""
+    element.source_file = filename
+    if isinstance(getattr(element, 'content', None), list):
+        for sub_element in element.content:
+            sub_element.source_file = filename
+
+
+def split_sections(elements: List[TexElement]) -> List[List[TexElement]]:
+    """Top-level elements grouped by section: each group starts with its
+    SectionElement, except the elements before the first section if any"""
+    sections: List[List[TexElement]] = []
+    for element in elements:
+        if element.element_type == ElementType.SECTION or not sections:
+            sections.append([])
+        sections[-1].append(element)
+    return sections
+
+
+def resolve_include(root_dir: str, name: str) -> str:
+    """Path of the file named by \\input{name} or \\include{name}"""
+    path = os.path.join(root_dir, name)
+    if not path.endswith('.tex') and os.path.isfile(path + '.tex'):
+        return path + '.tex'
+    if os.path.isfile(path):
+        return path
+    raise FileNotFoundError(f"Included LaTeX file not found: {path}")
+
+
+def parse_parallel(filename: str, max_workers: Optional[int] = None,
+                   engine: str = 'tokenizer', cache: Optional['ElementCache'] = None) -> List[TexElement]:
+    """Parse a multi-file document with one process per file
+    
+    Files are submitted as soon as the \\input or \\include naming them is
+    found, so independent chapters are parsed concurrently. The result is the
+    same element stream as TexParser(filename).parse(), in document order.
+    """
+    root_dir = os.path.dirname(filename)
+    parsed: Dict[str, List[TexElement]] = {}
+    
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        pending = {pool.submit(_parse_file, filename, engine, cache, root_dir): os.path.abspath(filename)}
+        submitted = set(pending.values())
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                path = pending.pop(future)
+                parsed[path] = future.result()
+                for element in parsed[path]:
+                    if element.element_type != ElementType.INCLUDE:
+                        continue
+                    included = resolve_include(root_dir, element.filename)
+                    if os.path.abspath(included) not in submitted:
+                        submitted.add(os.path.abspath(included))
+                        pending[pool.submit(_parse_file, included, engine, cache, root_dir)] = os.path.abspath(included)
+    
+    return _merge_includes(os.path.abspath(filename), parsed, root_dir)
+
+
+def _parse_file(filename: str, engine: str, cache: Optional['ElementCache'], root_dir: str) -> List[TexElement]:
+    """Worker of parse_parallel: one file, includes left unresolved"""
+    parser = TexParser(filename, quiet=True, engine=engine, cache=cache,
+                       resolve_includes=False, root_dir=root_dir)
+    return parser.parse()
+
+
+def _merge_includes(path: str, parsed: Dict[str, List[TexElement]], root_dir: str,
+                    chain: Tuple[str, ...] = ()) -> List[TexElement]:
+    """Elements of a parsed file with its includes replaced, recursively"""
+    merged = []
+    for element in parsed[path]:
+        if element.element_type != ElementType.INCLUDE:
+            merged.append(element)
+            continue
+        included = os.path.abspath(resolve_include(root_dir, element.filename))
+        if included in chain + (path,):
+            raise Exception(f"Circular include of {included} at line {element.line_number} of {path}")
+        merged.extend(_merge_includes(included, parsed, root_dir, chain + (path,)))
+    return merged
+
+
 # Example usage
 if __name__ == "__main__":
     parser = TexParser("SteinWeiss.tex")
@@ -0,0 +1,83 @@
+"""
+Presentation timeline
+Start time and duration of every element of a render, written as a report
+(timeline.csv) and checked against a time budget. With a dry run no frame is
+rasterized or encoded, so the timeline of a whole deck takes seconds.
+
+Usage: python timeline.py main.py MyPresentation --budget 900
+"""
+
+from dataclasses import dataclass
+from typing import List, Optional
+import argparse
+import csv
+import sys
+
+
+@dataclass
+class TimelineEntry:
+    """A top-level element (or the end of the document) of the video"""
+    element: str
+    source: str  # file:line of the element
+    start: float  # Seconds of video
+    duration: float
+    total: float  # Video length at the end of the element
+
+
+class Timeline:
+    """Entries of a render in video order"""
+
+    def __init__(self):
+        self.entries: List[TimelineEntry] = []
+
+    @property
+    def total(self) -> float:
+        return self.entries[-1].total if self.entries else 0.0
+
+    def add(self, element: str, source: str, start: float, end: float):
+        self.entries.append(TimelineEntry(element, source, start, end - start, end))
+
+    def save(self, path: str = "timeline.csv"):
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(["element", "source", "start", "duration", "total"])
+            for entry in self.entries:
+                writer.writerow([entry.element, entry.source, f"{entry.start:.3f}",
+                                 f"{entry.duration:.3f}", f"{entry.total:.3f}"])
+
+    def report(self) -> str:
+        """Text table of the entries"""
+        lines = [f"{'element':<12} {'source':<32} {'start':>9} {'duration':>9} {'total':>9}"]
+        for entry in self.entries:
+            lines.append(f"{entry.element:<12} {entry.source:<32} {entry.start:>9.2f} "
+                         f"{entry.duration:>9.2f} {entry.total:>9.2f}")
+        return "\n".join(lines)
+
+    def check_budget(self, budget: Optional[float]):
+        """Raise if the video is longer than budget seconds"""
+        if budget is not None and self.total > budget:
+            raise Exception(f"Video lasts {self.total:.1f}s, over the time budget of {budget:.1f}s")
+
+
+if __name__ == "__main__":
+    from manim import tempconfig
+    from section_render import load_scene_class
+
+    arguments = argparse.ArgumentParser(description="Timeline of a presentation without rendering frames")
+    arguments.add_argument("scene_file", help="Python file defining the scene, e.g. main.py")
+    arguments.add_argument("scene_name", help="TexToManimScene subclass, e.g. MyPresentation")
+    arguments.add_argument("--budget", type=float, default=None, help="Fail above this length, in seconds")
+    arguments.add_argument("-o", "--output", default="timeline.csv", help="Report file")
+    args = arguments.parse_args()
+
+    with tempconfig({"quality": "low_quality", "write_to_movie": False}):
+        scene = load_scene_class(args.scene_file, args.scene_name)(dry_run=True)
+        scene.TIME_BUDGET = None  # Checked below, after the report is written
+        scene.render()
+    scene.timeline.save(args.output)
+    print(scene.timeline.report())
+    try:
+        scene.timeline.check_budget(args.budget)
+    except Exception as e:
+        print(e)
+        sys.exit(1)
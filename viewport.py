@@ -0,0 +1,37 @@
+"""
+Viewport culling
+Vertical extents of the tracked mobjects in a numpy array, so that the
+renderer animates only what the camera can see
+"""
+
+from typing import List, Sequence, Tuple
+
+import numpy as np
+from manim import Mobject
+
+
+class Viewport:
+    """Horizontal band of the scene seen by the camera"""
+
+    def __init__(self, bottom: float, top: float):
+        self.bottom = bottom
+        self.top = top
+
+    def measure(self, mobjects: Sequence[Mobject]) -> np.ndarray:
+        """(bottom, top) of each mobject, NaN for mobjects without points"""
+        extents = np.full((len(mobjects), 2), np.nan)
+        for index, mobject in enumerate(mobjects):
+            points = mobject.get_all_points()
+            if len(points):
+                extents[index] = points[:, 1].min(), points[:, 1].max()
+        return extents
+
+    def visible(self, extents: np.ndarray, shift: float = 0.0) -> np.ndarray:
+        """Mask of the extents overlapping the band once moved up by shift"""
+        return (extents[:, 1] + shift > self.bottom) & (extents[:, 0] + shift < self.top)
+
+    def split(self, mobjects: Sequence[Mobject], mask: np.ndarray) -> Tuple[List[Mobject], List[Mobject]]:
+        """Mobjects where mask is set, and the others"""
+        selected = [mobject for mobject, keep in zip(mobjects, mask) if keep]
+        others = [mobject for mobject, keep in zip(mobjects, mask) if not keep]
+        return selected, others
@@ -0,0 +1,267 @@
+"""
+Watch mode
+Polls the .tex file (and the files it includes), reparses it through the
+element cache and renders only the elements whose content changed, alone on
+an empty screen at preview quality: a still of the final frame, or a short
+clip for the elements that leave the screen empty (theorems, sections). The
+result is shown in an OpenCV window.
+
+Usage: python watch.py main.py MyPresentation
+"""
+
+from dataclasses import fields, is_dataclass
+from difflib import SequenceMatcher
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+import argparse
+import os
+import re
+import time
+
+try:
+    import cv2
+except ImportError:  # Previews are only written to disk
+    cv2 = None
+
+from manim import config, tempconfig
+
+from element_cache import ElementCache
+from section_render import load_scene_class
+from segment_cache import content_key
+from tex_parser import ElementType, TexElement, TexParser
+
+
+NAME_WINDOW = 'Manim player preview'
+# Elements whose last frame is empty: previewed as a clip
+CLIP_TYPES = (ElementType.THEOREM, ElementType.LEMMA, ElementType.PROPOSITION, ElementType.SECTION)
+# Macro (\name) or environment ({name}) defined by a preamble line
+DEFINITION = re.compile(
+    r'\\(?:(?:re)?newcommand|providecommand|DeclareRobustCommand|DeclareMathOperator)\*?\s*\{?\s*(\\[A-Za-z@]+)'
+    r'|\\(?:[gex]?def|let)\s*(\\[A-Za-z@]+)'
+    r'|\\(?:re)?newenvironment\*?\s*\{([A-Za-z@*]+)\}'
+)
+
+
+class ElementPreviewMixin:
+    """Renders self.preview_element alone instead of the whole document"""
+
+    preview_element = None
+
+    def construct_document(self, format_dir=None):
+        self.setup_text_frame()
+        self.render_element(self.preview_element)
+        self.flush()
+
+
+def changed_elements(old_keys: List[str], new_keys: List[str]) -> List[int]:
+    """Indices of the new elements that are not in the old list"""
+    changed = []
+    for tag, _, _, j1, j2 in SequenceMatcher(None, old_keys, new_keys, autojunk=False).get_opcodes():
+        if tag in ('replace', 'insert'):
+            changed.extend(range(j1, j2))
+    return changed
+
+
+def changed_definitions(old_lines: List[str], new_lines: List[str]) -> Set[str]:
+    """Macros and environments defined by the preamble lines that differ"""
+    names = set()
+    for tag, i1, i2, j1, j2 in SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes():
+        if tag == 'equal':
+            continue
+        for line in old_lines[i1:i2] + new_lines[j1:j2]:
+            for match in DEFINITION.finditer(line.split('%', 1)[0]):
+                macro, defined, environment = match.groups()
+                names.add(macro or defined or f"{{{environment}}}")
+    return names
+
+
+def element_text(element) -> str:
+    """LaTeX source of an element and of its sub-elements"""
+    if not is_dataclass(element):
+        element = element.materialize()  # Compact elements
+    parts = []
+    for element_field in fields(element):
+        values = getattr(element, element_field.name)
+        for value in values if isinstance(values, list) else [values]:
+            if isinstance(value, TexElement) or hasattr(value, 'materialize'):
+                parts.append(element_text(value))
+            elif isinstance(value, list):
+                parts.extend(item for item in value if isinstance(item, str))  # Rows of an align
+            elif isinstance(value, str):
+                parts.append(value)
+    return "\n".join(parts)
+
+
+def uses(text: str, names: Set[str]) -> bool:
+    """Whether text uses one of the macros (\\name) or environments ({name})"""
+    for name in names:
+        pattern = re.escape(name) + r'(?![A-Za-z@])' if name.startswith('\\') else r'\\begin\s*' + re.escape(name)
+        if re.search(pattern, text):
+            return True
+    return False
+
+
+def source_times(filenames) -> Dict[str, float]:
+    times = {}
+    for filename in filenames:
+        try:
+            times[filename] = os.stat(filename).st_mtime
+        except OSError:
+            times[filename] = 0.0
+    return times
+
+
+class Watcher:
+    """Re-renders the edited elements of a TexToManimScene subclass"""
+
+    def __init__(self, scene_file: str, scene_name: str, clip: Optional[bool] = None, quality: str = "low_quality",
+                 latex_filename: Optional[str] = None):
+        scene_class = load_scene_class(scene_file, scene_name)
+        self.latex_filename = latex_filename or getattr(scene_class, "LATEX_FILENAME", None)
+        if self.latex_filename is None:
+            raise Exception(f"No .tex file for {scene_name}: set its LATEX_FILENAME or pass --tex")
+        self.preview_class = type("ElementPreview", (ElementPreviewMixin, scene_class),
+                                  {"LATEX_FILENAME": self.latex_filename})
+        self.clip = clip  # None: clip for CLIP_TYPES only
+        self.quality = quality
+        self.cache = ElementCache(os.path.join(config.media_dir, "parser_cache"))
+        self.keys: List[str] = []
+        self.preamble_hash = None
+        self.preamble: List[str] = []
+        self.last_edited: Optional[Tuple[str, int]] = None  # Source file and line of the last previewed element
+        self.elements = self.parse()
+        self.times = source_times(self.sources())
+
+    def parse(self):
+        parser = TexParser(self.latex_filename, quiet=True, cache=self.cache)
+        elements = parser.parse()
+        document = parser.load_document()
+        self.preamble_hash, self.preamble = document.preamble_hash, document.preamble
+        return elements
+
+    def sources(self) -> List[str]:
+        return sorted({self.latex_filename} | {element.source_file for element in self.elements if element.source_file})
+
+    def poll(self) -> List[str]:
+        """Previews of the elements edited since the last poll"""
+        times = source_times(self.sources())
+        if times == self.times:
+            return []
+        self.times = times
+        start = time.perf_counter()
+        preamble_hash, preamble = self.preamble_hash, self.preamble
+        try:
+            elements = self.parse()
+        except Exception as e:
+            print(f"Parse error: {e}")
+            return []
+        keys = [content_key(element) for element in elements]
+        changed = changed_elements([content_key(element) for element in self.elements], keys)
+        if preamble_hash != self.preamble_hash and elements:
+            changed = sorted(set(changed) | {self.affected_by(preamble, elements)})
+        self.elements, self.times = elements, source_times(self.sources())
+        if changed:
+            self.last_edited = (elements[changed[-1]].source_file, elements[changed[-1]].line_number)
+
+        previews = []
+        for index in changed:
+            try:
+                previews.append(self.render(elements[index]))
+            except Exception as e:
+                print(f"Render error at {elements[index].source_file}:{elements[index].line_number}: {e}")
+        if changed:
+            print(f"{len(changed)} element(s) previewed in {time.perf_counter() - start:.2f}s")
+        return previews
+
+    def affected_by(self, old_preamble: List[str], elements) -> int:
+        """Element to preview after a preamble change: the first one using a
+        macro or environment whose definition changed, else the one nearest
+        the last edited element, else the first one"""
+        names = changed_definitions(old_preamble, self.preamble)
+        for index, element in enumerate(elements):
+            if names and uses(element_text(element), names):
+                print(f"Preamble changed ({', '.join(sorted(names))}): previewing its first use")
+                return index
+        print("Preamble changed: previewing the element nearest the last edit")
+        if self.last_edited is None:
+            return 0
+        source_file, line_number = self.last_edited
+        return min(range(len(elements)), key=lambda index: (elements[index].source_file != source_file,
+                                                            abs(elements[index].line_number - line_number)))
+
+    def render(self, element) -> str:
+        """Render element at preview quality, return the image or video"""
+        clip = self.clip if self.clip is not None else element.element_type in CLIP_TYPES
+        overrides = {
+            "quality": self.quality, "preview": False, "verbosity": "WARNING",
+            "save_last_frame": not clip, "write_to_movie": clip,
+            "output_file": f"preview_{Path(element.source_file or self.latex_filename).stem}_{element.line_number}",
+        }
+        with tempconfig(overrides):
+            scene = self.preview_class(dry_run=not clip)
+            scene.preview_element = element
+            scene.BATCH_TEX = False
+            scene.REUSE_SEGMENTS = False
+            scene.KEYFRAMES_AT_CHECKPOINTS = False
+            scene.SLIDE_SEGMENTS = False
+            scene.render()
+            file_writer = scene.renderer.file_writer
+            output = file_writer.movie_file_path if clip else file_writer.image_file_path
+        print(f"{element.element_type.value} at {element.source_file}:{element.line_number}: {output}")
+        return str(output)
+
+    def run(self, interval: float = 0.2):
+        print(f"Watching {', '.join(self.sources())} (q in the preview window or Ctrl+C to stop)")
+        window = False  # cv2.waitKey returns at once while no window is open
+        try:
+            while True:
+                for preview in self.poll():
+                    window = show(preview) or window
+                if window:
+                    if cv2.waitKey(int(interval * 1000)) & 0xFF == ord('q'):
+                        break
+                else:
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        if cv2 is not None:
+            cv2.destroyAllWindows()
+
+
+def show(preview: str) -> bool:
+    """Show a still, or play a clip and keep its last frame. Returns
+    whether the preview window shows something."""
+    if cv2 is None:
+        return False
+    if Path(preview).suffix == ".png":
+        image = cv2.imread(preview)
+        if image is None:
+            return False
+        cv2.imshow(NAME_WINDOW, image)
+        cv2.waitKey(1)
+        return True
+    cap = cv2.VideoCapture(preview)
+    delay = int(1000 / (cap.get(cv2.CAP_PROP_FPS) or config.frame_rate))
+    shown = False
+    ret, frame = cap.read()
+    while ret:
+        cv2.imshow(NAME_WINDOW, frame)
+        cv2.waitKey(delay)
+        shown = True
+        ret, frame = cap.read()
+    cap.release()
+    return shown
+
+
+if __name__ == "__main__":
+    arguments = argparse.ArgumentParser(description="Preview the edited elements of a presentation on save")
+    arguments.add_argument("scene_file", help="Python file defining the scene, e.g. main.py")
+    arguments.add_argument("scene_name", help="TexToManimScene subclass, e.g. MyPresentation")
+    mode = arguments.add_mutually_exclusive_group()
+    mode.add_argument("--clip", action="store_true", default=None, help="Always preview a clip")
+    mode.add_argument("--still", dest="clip", action="store_false", help="Always preview the last frame")
+    arguments.add_argument("--interval", type=float, default=0.2, help="Seconds between checks")
+    arguments.add_argument("--tex", default=None, help="The .tex file, if the scene has no LATEX_FILENAME")
+    args = arguments.parse_args()
+
+    Watcher(args.scene_file, args.scene_name, args.clip, latex_filename=args.tex).run(args.interval)